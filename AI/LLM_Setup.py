@@ -3,75 +3,347 @@ import os
 from dotenv import load_dotenv
 load_dotenv()
 
-from groq import Groq
-
-import time
 import asyncio
+import time
+from collections import Counter, defaultdict
 import ollama
 
-def fetch_api_chat_completion(query, model="llama-3.3-70b-versatile", attempt=1) -> str:
-    client = Groq(
-        api_key=os.getenv("GROQ_API_KEY"),
-    )
-    if attempt > 5:
-        raise Exception("Max retries exceeded for fetch_chat_completion")
+from AI.response_cache import ResponseCache, cache_key
+from AI.retry import CircuitBreaker, RetryPolicy
+from AI.concurrency import AdaptiveLimiter
+from AI.groq_backend import GroqBackend
+from AI.client_pool import OllamaClientPool
+from AI.telemetry import CallTelemetry, CURRENT_BATCH, ollama_timings
+
+DEFAULT_LOCAL_MODEL = "mistral:7b-instruct"
+DEFAULT_API_MODEL = "llama-3.3-70b-versatile"
+
+_response_cache = None
+_telemetry = None
+_groq_backend = None
+METRICS_PATH = None
+_ollama_pool = None
+
+# Comma-separated Ollama endpoints (e.g. "http://box1:11434,http://box2:11434");
+# requests are balanced across them. Unset uses the single default host.
+OLLAMA_HOSTS = [host.strip() for host in os.getenv("OLLAMA_HOSTS", "").split(",") if host.strip()]
+
+# cache key -> task of the identical request already on the wire, and how many
+# callers per stage were attached to one instead of sending their own
+_in_flight = {}
+COALESCED = Counter()
+
+# (model, stage) -> Ollama prefill counters: requests, tokens evaluated, estimated
+# full prompt tokens, nanoseconds spent, the largest prompt seen, and the
+# tokens-per-estimate ratio of the coldest request (a prompt evaluated in full)
+PROMPT_EVAL_STATS = defaultdict(Counter)
+
+# One retry policy per backend, so an Ollama outage opens the Ollama breaker only.
+# stage_budget caps the transport retries any single stage may spend in a run.
+RETRY_POLICIES = {
+    "ollama": RetryPolicy(max_attempts=5, base_delay=1.0, max_delay=30.0, stage_budget=500,
+                          breaker=CircuitBreaker(failure_threshold=5, reset_timeout=15.0, name="Ollama")),
+    "groq": RetryPolicy(max_attempts=5, base_delay=2.0, max_delay=60.0, stage_budget=500,
+                        breaker=CircuitBreaker(failure_threshold=5, reset_timeout=30.0, name="Groq")),
+}
+
+# stage -> streamed replies cut off once they held a complete answer
+EARLY_STOPS = Counter()
+
+# Parts still read after stop_when holds, waiting for the final part with Ollama's
+# timings and token counts; a constrained JSON reply sends it right after the
+# closing brace. Only a reply still going after this many parts is cut off.
+STOP_GRACE_PARTS = int(os.getenv("STREAM_STOP_GRACE_PARTS", "8"))
+
+# (backend, model) -> AdaptiveLimiter deciding how many requests may be in flight
+_limiters = {}
+INITIAL_CONCURRENCY = int(os.getenv("LLM_INITIAL_CONCURRENCY", "4"))
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "64"))
+
+# Ollama context window (num_ctx) sent with every request, so prompts packed to fit
+# it are not cut from the front by a smaller server default. One value for the
+# whole run: a request with a different num_ctx makes Ollama reload the model.
+NUM_CTX = int(os.getenv("SCORE_CONTEXT_TOKENS", "4096"))
+
+# Per-model Ollama keep_alive sent with every request, set by the model scheduler
+# in main so a model stays loaded for its whole run.
+KEEP_ALIVE = {}
+
+
+def set_keep_alive(model, keep_alive=None):
+    if keep_alive is None:
+        KEEP_ALIVE.pop(model, None)
+    else:
+        KEEP_ALIVE[model] = keep_alive
+
+
+def configure_response_cache(path="data/llm_cache.sqlite", enabled=True, **kwargs):
+    """Open (or disable) the shared on-disk response cache used by fetch_chat_completion."""
+    global _response_cache
+    if _response_cache is not None:
+        _response_cache.close()
+    _response_cache = ResponseCache(path, **kwargs) if enabled else False
+    return _response_cache or None
+
+
+def get_response_cache():
+    if _response_cache is None:
+        configure_response_cache(enabled=os.getenv("LLM_CACHE", "1") != "0")
+    return _response_cache or None
+
+def configure_telemetry(path="data/llm_calls.jsonl", metrics_path="data/llm_metrics.prom", enabled=True):
+    """Start (or disable) per-call telemetry; records go to path as JSON lines."""
+    global _telemetry, METRICS_PATH
+    if _telemetry:
+        _telemetry.close()
+    _telemetry = CallTelemetry(path) if enabled else False
+    METRICS_PATH = metrics_path
+    return _telemetry or None
+
+
+def get_telemetry():
+    if _telemetry is None:
+        configure_telemetry(path=os.getenv("LLM_TELEMETRY_PATH", "data/llm_calls.jsonl"),
+                            metrics_path=os.getenv("LLM_METRICS_PATH", "data/llm_metrics.prom"),
+                            enabled=os.getenv("LLM_TELEMETRY", "1") != "0")
+    return _telemetry or None
+
+
+def report_telemetry():
+    """Print the per-stage call summary and write it to METRICS_PATH for Prometheus."""
+    telemetry = get_telemetry()
+    if telemetry is None or not telemetry.calls:
+        return
+    telemetry.report()
+    if METRICS_PATH:
+        telemetry.write_prometheus(METRICS_PATH)
+        print(f"Wrote call metrics to {METRICS_PATH}")
+
+async def fetch_api_chat_completion(query, model="llama-3.3-70b-versatile", client=None, format=None, max_tokens=None) -> str:
+    """One Groq request through the shared, rate-limited backend."""
+    if client is None:
+        client = get_groq_backend()
+    return await client.complete(query, model=model, format=format, max_tokens=max_tokens)
+
+
+async def fetch_chat_completion(query, model=None, client=None, local=True, stage=None, options=None, refresh=False, format=None,
+                                stop_when=None) -> str:
+    """Return the model's reply to query, serving repeated prompts from the response cache.
+
+    A caller whose request is identical to one still in flight waits for that
+    reply instead of sending a duplicate. refresh=True skips the cache lookup
+    and the in-flight request (used when a reply failed to parse) and
+    overwrites the stored entry with the new reply. format is an optional JSON
+    schema the reply must follow. options["num_predict"] caps the reply length
+    on both backends, and stop_when(text) ends a local reply early once the
+    text so far holds everything the caller needs.
+    """
+    backend = "ollama" if local else "groq"
+    if model is None:
+        model = DEFAULT_LOCAL_MODEL if local else DEFAULT_API_MODEL
+    cache = get_response_cache()
+    key = cache_key(backend, model, query, options, format)
+    if cache is not None and not refresh:
+        cached = cache.get(key, stage=stage)
+        if cached is not None:
+            return cached
+    if not refresh and key in _in_flight:
+        COALESCED[stage] += 1
+        return await asyncio.shield(_in_flight[key])
 
-    try:
-        chat_completion = client.chat.completions.create(
-            messages=[
-                {
-                    "role": "user",
-                    "content": query,
-                }
-            ],
-            model=model,
-        )
-        return chat_completion.choices[0].message.content
-    except Exception as e:
-        # Check if it's a rate limit error or any other error
-        if "rate limit" in str(e).lower() or "429" in str(e):
-            print(f"Attempt {attempt}: Rate limit hit, waiting 10 seconds...")
-        else:
-            print(f"Attempt {attempt}: API call failed with error: {e}, waiting 10 seconds...")
-        
-        time.sleep(10)
-        
-        return fetch_api_chat_completion(query, model=model, attempt=attempt + 1)
-
-
-async def fetch_chat_completion(query, model=None, client=None, local=True) -> str:
     if client is None:
         client = create_ollama_client(local=local)
     if not local:
-        return fetch_api_chat_completion(query, model=model, client=client)
+        max_tokens = (options or {}).get("num_predict")
+        request = lambda call: fetch_api_chat_completion(query, model=model, client=client, format=format, max_tokens=max_tokens)
     else:
-        return await fetch_local_model_completion(query, model=model, client=client)
+        request = lambda call: fetch_local_model_completion(query, model=model, client=client, options=options, format=format, stage=stage,
+                                                            stop_when=stop_when, call=call)
+
+    limiter = get_limiter(backend, model)
+    telemetry = get_telemetry()
+    batch = CURRENT_BATCH.get()
+    attempts = 0
+
+    async def attempt():
+        nonlocal attempts
+        attempts += 1
+        call = {'backend': backend, 'model': model, 'stage': stage, 'batch': batch, 'attempt': attempts, 'refresh': refresh}
+        queued = time.monotonic()
+        async with limiter.slot():
+            started = time.monotonic()
+            call['queue_s'] = started - queued
+            try:
+                return await request(call)
+            except BaseException as e:
+                call['error'] = type(e).__name__
+                raise
+            finally:
+                call['latency_s'] = time.monotonic() - started
+                if telemetry is not None:
+                    telemetry.record(call)
+
+    async def send():
+        response = await RETRY_POLICIES[backend].call(attempt, stage=stage, description=f"{backend} {model} call")
+        if cache is not None:
+            cache.put(key, response)
+        return response
+
+    # Shielded so a cancelled caller does not cancel the reply others are waiting on
+    task = asyncio.ensure_future(send())
+    if not refresh:
+        _in_flight[key] = task
+        task.add_done_callback(lambda done: _in_flight.pop(key) if _in_flight.get(key) is done else None)
+    return await asyncio.shield(task)
+
+
+def record_prompt_eval(model, stage, response, query):
+    count = response.get("prompt_eval_count")
+    if count is None:
+        return
+    estimate = max(1, (len(query) + 3) // 4)  # the whole prompt, at about four characters per token
+    stats = PROMPT_EVAL_STATS[(model, stage)]
+    stats['requests'] += 1
+    stats['tokens'] += count
+    stats['estimated_tokens'] += estimate
+    stats['nanoseconds'] += response.get("prompt_eval_duration") or 0
+    stats['full_prompt_tokens'] = max(stats['full_prompt_tokens'], count)
+    # Tokens per estimated token on the coldest request seen, which prefilled its whole prompt
+    stats['cold_ratio'] = max(stats['cold_ratio'], count / estimate)
+
+
+def report_prompt_eval():
+    """Prefill work per stage, and the time prefix reuse saved.
+
+    Ollama only counts the prompt tokens it had to evaluate, so a request that
+    reused a cached prefix reports fewer tokens than its prompt holds. Each
+    request's full size is estimated from its own text, scaled to Ollama's
+    tokenizer by the stage's coldest request, and the shortfall is priced at
+    the stage's measured prefill rate.
+    """
+    for (model, stage), stats in sorted(PROMPT_EVAL_STATS.items(), key=lambda kv: (str(kv[0][0]), str(kv[0][1]))):
+        requests, tokens = stats['requests'], stats['tokens']
+        seconds_per_token = stats['nanoseconds'] / tokens / 1e9 if tokens else 0
+        full_tokens = stats['estimated_tokens'] * stats['cold_ratio']
+        saved = max(0.0, full_tokens - tokens) * seconds_per_token
+        print(f"{model} {stage}: {requests} prompts, {tokens / requests:.0f} of ~{full_tokens / requests:.0f} tokens prefilled on average "
+              f"(largest {stats['full_prompt_tokens']}), {stats['nanoseconds'] / 1e9:.1f}s prefill, ~{saved:.1f}s saved by prefix reuse")
+
+
+def get_limiter(backend, model):
+    """The concurrency limiter for one backend and model, created on first use."""
+    if (backend, model) not in _limiters:
+        _limiters[(backend, model)] = AdaptiveLimiter(f"{backend} {model}", initial=INITIAL_CONCURRENCY, max_limit=MAX_CONCURRENCY)
+    return _limiters[(backend, model)]
+
+
+def report_concurrency():
+    for limiter in _limiters.values():
+        limiter.report()
+
+
+def report_coalesced():
+    for stage, count in sorted(COALESCED.items(), key=lambda kv: str(kv[0])):
+        print(f"{stage}: {count} identical in-flight requests coalesced")
+    for stage, count in sorted(EARLY_STOPS.items(), key=lambda kv: str(kv[0])):
+        print(f"{stage}: {count} replies stopped early once the answer was complete")
 
 def create_ollama_client(local=True):
     if not local:
-        return Groq(api_key=os.getenv("GROQ_API_KEY"))
+        return get_groq_backend()
+    elif OLLAMA_HOSTS:
+        return get_ollama_pool()
     else:
         return ollama.AsyncClient()
 
-async def fetch_local_model_completion(query, model="llama2", client=None) -> str:
+
+def get_ollama_pool():
+    """The run's shared pool over OLLAMA_HOSTS, created on first use."""
+    global _ollama_pool
+    if _ollama_pool is None:
+        _ollama_pool = OllamaClientPool(OLLAMA_HOSTS, health_interval=float(os.getenv("OLLAMA_HEALTH_INTERVAL", "15")))
+    return _ollama_pool
+
+
+def report_hosts():
+    if _ollama_pool is not None:
+        _ollama_pool.report()
+
+
+def get_groq_backend():
+    """The run's shared Groq client, created on first use."""
+    global _groq_backend
+    if _groq_backend is None:
+        _groq_backend = GroqBackend(
+            requests_per_minute=float(os.getenv("GROQ_REQUESTS_PER_MINUTE", "30")),
+            tokens_per_minute=float(os.getenv("GROQ_TOKENS_PER_MINUTE", "6000")),
+        )
+    return _groq_backend
+
+async def fetch_local_model_completion(query, model="llama2", client=None, options=None, format=None, stage=None, stop_when=None,
+                                       call=None) -> str:
+    """One Ollama chat request.
+
+    With stop_when the reply is streamed and the text is final as soon as
+    stop_when(text so far) is true. Up to STOP_GRACE_PARTS more parts are
+    read to pick up Ollama's final part with its counts; a reply still
+    generating after that is closed, which makes Ollama stop. Ollama's
+    timings and token counts are added to the call dict if given; for a
+    stream stopped early, which never gets them, the streamed token count,
+    time to first token and streaming time are added instead.
+    """
     if client is not None:
         client = client
     else:
-        client = ollama.AsyncClient()
+        client = create_ollama_client(local=True)
     if model is None:
-        model = "mistral:7b-instruct"
+        model = DEFAULT_LOCAL_MODEL
+    options = {"num_ctx": NUM_CTX, **(options or {})}
+    if stop_when is None:
+        response = await client.chat(model=model, messages=[{"role": "user", "content": query}], stream=False, options=options, format=format, keep_alive=KEEP_ALIVE.get(model))
+        record_prompt_eval(model, stage, response, query)
+        if call is not None:
+            call.update(ollama_timings(response))
+        return response["message"]["content"]
+
+    started = time.monotonic()
+    stream = await client.chat(model=model, messages=[{"role": "user", "content": query}], stream=True, options=options, format=format, keep_alive=KEEP_ALIVE.get(model))
+    text = ""
+    answer = None  # the text when stop_when first held
+    answered_at = 0
+    done = False
+    chunks = 0
+    first_chunk = None
     try:
-        response = await client.chat(model=model, messages=[{"role": "user", "content": query}], stream=False)
-    except Exception as e:
-        print(f"Local model call failed with error: {e}")
-        print("Waiting 10 seconds before retrying...")
-        time.sleep(10)
-        result = ollama.generate(model=model, prompt=query)
-    return response["message"]["content"]
+        async for part in stream:
+            text += part["message"]["content"]
+            if part.get("done"):
+                done = True
+                record_prompt_eval(model, stage, part, query)  # only the final part carries the counts
+                if call is not None:
+                    call.update(ollama_timings(part))
+                break
+            chunks += 1  # Ollama streams one generated token per part
+            if first_chunk is None:
+                first_chunk = time.monotonic()
+            if answer is None:
+                if stop_when(text):
+                    answer, answered_at = text, chunks
+            elif chunks - answered_at >= STOP_GRACE_PARTS:
+                break
+    finally:
+        await stream.aclose()
+    if answer is not None and not done:
+        EARLY_STOPS[stage] += 1
+        if call is not None:
+            # Ollama's counts only come with the final part, so keep what the stream showed
+            call.update(early_stop=True, streamed_tokens=chunks, first_token_s=first_chunk - started,
+                        stream_s=time.monotonic() - first_chunk)
+    return answer if answer is not None else text
 
 if __name__ == '__main__':
     test_query = "What is the capital of France?"
 
     print("Testing fetch_local_model_completion...")
-    local_response = fetch_local_model_completion(test_query)
+    local_response = asyncio.run(fetch_local_model_completion(test_query))
     print(f"Local Model Response: {local_response}")
\ No newline at end of file
@@ -0,0 +1,152 @@
+import asyncio
+
+import httpx
+import ollama
+
+
+def is_host_failure(error) -> bool:
+    """Errors that say the host is unreachable or overloaded, not that the request was bad."""
+    if isinstance(error, (ConnectionError, httpx.TransportError, asyncio.TimeoutError)):
+        return True
+    return getattr(error, "status_code", None) in (502, 503, 504)
+
+
+class Replica:
+    """One Ollama host, with the requests currently sent to it and the models it has loaded."""
+
+    def __init__(self, host):
+        self.host = host
+        self.client = ollama.AsyncClient(host=host)
+        self.healthy = True
+        self.models = set()
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.last_error = None
+
+
+class OllamaClientPool:
+    """Spreads Ollama requests over several hosts, least outstanding requests first.
+
+    Stands in for ollama.AsyncClient: chat() goes to the healthy host with the
+    fewest requests in flight, preferring hosts that already have the model
+    loaded. A host that fails to connect is marked down and the request moves
+    to the next one; a background check every health_interval seconds reads
+    each host's loaded models from /api/ps and brings recovered hosts back.
+    generate() (used to load and unload models) is sent to every healthy host.
+    """
+
+    def __init__(self, hosts, health_interval=15.0, health_timeout=5.0):
+        if not hosts:
+            raise ValueError("OllamaClientPool needs at least one host")
+        self.replicas = [Replica(host) for host in hosts]
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self._health_task = None
+
+    def pick(self, model, exclude=()) -> Replica:
+        candidates = [replica for replica in self.replicas if replica.healthy and replica not in exclude]
+        if not candidates:
+            # Everything looks down: try the hosts not tried yet rather than failing outright
+            candidates = [replica for replica in self.replicas if replica not in exclude]
+        if not candidates:
+            return None
+        loaded = [replica for replica in candidates if model in replica.models]
+        return min(loaded or candidates, key=lambda replica: (replica.outstanding, replica.requests))
+
+    def mark_down(self, replica, error):
+        replica.failures += 1
+        replica.last_error = error
+        if replica.healthy:
+            replica.healthy = False
+            print(f"Ollama host {replica.host} is down ({error}), routing around it")
+
+    def mark_up(self, replica):
+        if not replica.healthy:
+            replica.healthy = True
+            print(f"Ollama host {replica.host} is back")
+
+    async def chat(self, model=None, stream=False, **kwargs):
+        self.start_health_checks()
+        tried = []
+        while True:
+            replica = self.pick(model, exclude=tried)
+            if replica is None:
+                raise tried[-1].last_error
+            tried.append(replica)
+            replica.outstanding += 1
+            replica.requests += 1
+            try:
+                response = await replica.client.chat(model=model, stream=stream, **kwargs)
+                if stream:
+                    # Ollama connects on the first read, so fail over before handing the stream back
+                    first = await response.__anext__()
+                    self.mark_up(replica)
+                    replica.models.add(model)
+                    return self._stream(replica, first, response)
+            except Exception as e:
+                replica.outstanding -= 1
+                if not is_host_failure(e):
+                    raise
+                self.mark_down(replica, e)
+                continue
+            replica.outstanding -= 1
+            self.mark_up(replica)
+            replica.models.add(model)
+            return response
+
+    async def _stream(self, replica, first, stream):
+        try:
+            yield first
+            async for part in stream:
+                yield part
+        finally:
+            replica.outstanding -= 1
+            await stream.aclose()
+
+    async def generate(self, model=None, **kwargs):
+        """Send to every healthy host, so warm-up and unload apply to the whole pool."""
+        replicas = [replica for replica in self.replicas if replica.healthy] or self.replicas
+        results = await asyncio.gather(*(replica.client.generate(model=model, **kwargs) for replica in replicas), return_exceptions=True)
+        response = None
+        for replica, result in zip(replicas, results):
+            if isinstance(result, Exception):
+                if not is_host_failure(result):
+                    raise result
+                self.mark_down(replica, result)
+            elif response is None:
+                response = result
+        if response is None:
+            raise results[-1]
+        return response
+
+    async def check_health(self):
+        async def check(replica):
+            try:
+                running = await asyncio.wait_for(replica.client.ps(), self.health_timeout)
+            except Exception as e:
+                self.mark_down(replica, e)
+                return
+            replica.models = {model.model for model in running.models}
+            self.mark_up(replica)
+
+        await asyncio.gather(*(check(replica) for replica in self.replicas))
+
+    def start_health_checks(self):
+        if self._health_task is None or self._health_task.done():
+            self._health_task = asyncio.get_running_loop().create_task(self._health_loop())
+
+    async def _health_loop(self):
+        while True:
+            await self.check_health()
+            await asyncio.sleep(self.health_interval)
+
+    async def close(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+
+    def report(self):
+        for replica in self.replicas:
+            state = "up" if replica.healthy else f"down ({replica.last_error})"
+            print(f"Ollama host {replica.host}: {replica.requests} requests, {replica.failures} failures, {state}")
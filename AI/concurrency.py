@@ -0,0 +1,90 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit for one backend and model.
+
+    After each window of completed requests the limit grows by one while
+    throughput rises, and shrinks by one once throughput is flat but latency
+    keeps climbing (requests only queue up). It is halved when requests fail
+    and cut by a quarter when latency passes latency_tolerance times the best
+    seen. Every change is printed and kept in history as (seconds since
+    start, limit, reason).
+    """
+
+    def __init__(self, name, initial=4, min_limit=1, max_limit=64, latency_tolerance=2.0, min_window=4):
+        self.name = name
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_tolerance = latency_tolerance
+        self.min_window = min_window
+        self.in_flight = 0
+        self.baseline = None
+        self.last_throughput = None
+        self.last_latency = None
+        self.window = []
+        self.window_started = None
+        self.started = time.monotonic()
+        self.history = [(0.0, initial, "start")]
+        self._cond = asyncio.Condition()
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one in-flight slot for the duration of a request."""
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+            if self.window_started is None:
+                self.window_started = time.monotonic()
+        start = time.monotonic()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            async with self._cond:
+                self.in_flight -= 1
+                self.record(time.monotonic() - start, ok)
+                self._cond.notify_all()
+
+    def record(self, latency, ok):
+        self.window.append((latency, ok))
+        if len(self.window) < max(self.min_window, int(self.limit)):
+            return
+        now = time.monotonic()
+        throughput = len(self.window) / max(now - self.window_started, 1e-6)
+        mean_latency = sum(latency for latency, _ in self.window) / len(self.window)
+        errors = sum(not ok for _, ok in self.window)
+        self.window, self.window_started = [], now
+
+        # Best latency seen, allowed to drift slowly up with a lasting change in prompt sizes
+        if self.baseline is None or mean_latency < self.baseline:
+            self.baseline = mean_latency
+        else:
+            self.baseline += 0.01 * (mean_latency - self.baseline)
+
+        if errors:
+            self.set_limit(self.limit * 0.5, f"{errors} errors")
+        elif mean_latency > self.latency_tolerance * self.baseline:
+            self.set_limit(self.limit * 0.75, f"latency {mean_latency:.2f}s over {self.baseline:.2f}s baseline")
+        elif self.last_throughput is None or throughput > 1.05 * self.last_throughput:
+            self.set_limit(self.limit + 1, f"throughput up to {throughput:.2f}/s")
+        elif mean_latency > 1.1 * self.last_latency:
+            self.set_limit(self.limit - 1, f"throughput flat at {throughput:.2f}/s, latency up to {mean_latency:.2f}s")
+        self.last_throughput = throughput
+        self.last_latency = mean_latency
+
+    def set_limit(self, limit, reason):
+        limit = min(self.max_limit, max(self.min_limit, limit))
+        if int(limit) != int(self.limit):
+            print(f"{self.name}: concurrency {int(self.limit)} -> {int(limit)} ({reason})")
+            self.history.append((time.monotonic() - self.started, int(limit), reason))
+        self.limit = limit
+
+    def report(self):
+        limits = [limit for _, limit, _ in self.history]
+        timeline = ", ".join(f"{limit}@{seconds:.0f}s" for seconds, limit, _ in self.history[-12:])
+        print(f"{self.name}: concurrency now {int(self.limit)} (range {min(limits)}-{max(limits)}); {timeline}")
@@ -0,0 +1,147 @@
+import asyncio
+import math
+import os
+import re
+import time
+
+import httpx
+from groq import AsyncGroq, DefaultAsyncHttpxClient, RateLimitError
+
+
+def parse_reset(value) -> float:
+    """Seconds from a Groq reset header such as '7.66s', '2m59.56s' or '120ms'."""
+    if value is None:
+        return 0.0
+    total = 0.0
+    for amount, unit in re.findall(r"([\d.]+)(ms|h|m|s)", str(value)):
+        total += float(amount) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    if total == 0.0:
+        try:
+            total = float(value)
+        except ValueError:
+            pass
+    return total
+
+
+class TokenBucket:
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.level = capacity
+        self.rate = rate
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount) -> float:
+        self.refill()
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate if self.rate > 0 else 1.0
+
+    def sync(self, limit, remaining, reset):
+        """Adopt the provider's view of this bucket from its response headers."""
+        self.refill()
+        if limit:
+            self.capacity = limit
+        if remaining is not None:
+            self.level = min(self.level, remaining)
+        if reset > 0 and self.capacity > self.level:
+            self.rate = (self.capacity - self.level) / reset
+
+
+class RateLimiter:
+    """Request and token buckets kept in step with Groq's x-ratelimit-* headers.
+
+    Groq's request headers count requests per day and its token headers
+    tokens per minute, so the configured requests-per-minute bucket is kept
+    as its own cap and only the daily request and per-minute token buckets
+    are synced from the headers. Callers wait in arrival order until every
+    bucket can cover the request, and a 429 with retry-after blocks everyone
+    until the provider is ready.
+    """
+
+    # header suffix -> bucket it describes
+    HEADER_BUCKETS = {"requests": "requests_per_day", "tokens": "tokens"}
+
+    def __init__(self, requests_per_minute=30, tokens_per_minute=6000):
+        self.buckets = {
+            "requests": TokenBucket(requests_per_minute, requests_per_minute / 60),
+            # Unlimited until the first response reports the daily allowance
+            "requests_per_day": TokenBucket(math.inf, 0.0),
+            "tokens": TokenBucket(tokens_per_minute, tokens_per_minute / 60),
+        }
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens):
+        async with self._lock:
+            while True:
+                tokens = min(tokens, self.buckets["tokens"].capacity)
+                wait = max(self.blocked_until - time.monotonic(),
+                           self.buckets["requests"].wait_time(1),
+                           self.buckets["requests_per_day"].wait_time(1),
+                           self.buckets["tokens"].wait_time(tokens))
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            self.buckets["requests"].level -= 1
+            self.buckets["requests_per_day"].level -= 1
+            self.buckets["tokens"].level -= tokens
+
+    def update(self, headers):
+        for kind, name in self.HEADER_BUCKETS.items():
+            limit = headers.get(f"x-ratelimit-limit-{kind}")
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            if limit is None and remaining is None:
+                continue
+            self.buckets[name].sync(float(limit) if limit else None,
+                                    float(remaining) if remaining is not None else None,
+                                    parse_reset(headers.get(f"x-ratelimit-reset-{kind}")))
+        retry_after = headers.get("retry-after")
+        if retry_after is not None:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + parse_reset(retry_after))
+
+
+class GroqBackend:
+    """One pooled AsyncGroq client per run, rate limited from response headers.
+
+    base_url (or GROQ_BASE_URL) lets it run against a local stub server.
+    Retries are left to the caller's RetryPolicy, so the SDK's own are off.
+    """
+
+    def __init__(self, api_key=None, base_url=None, max_connections=16, requests_per_minute=30,
+                 tokens_per_minute=6000, max_output_tokens=256):
+        self.client = AsyncGroq(
+            api_key=api_key or os.getenv("GROQ_API_KEY"),
+            base_url=base_url or os.getenv("GROQ_BASE_URL"),
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(limits=httpx.Limits(max_connections=max_connections,
+                                                                    max_keepalive_connections=max_connections)),
+        )
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.max_output_tokens = max_output_tokens
+
+    async def complete(self, query, model, format=None, max_tokens=None) -> str:
+        # Groq has no schema-constrained decoding, only plain JSON mode
+        kwargs = {"response_format": {"type": "json_object"}} if format is not None else {}
+        if max_tokens is not None:
+            kwargs["max_tokens"] = max_tokens
+        await self.limiter.acquire(len(query) // 4 + (max_tokens or self.max_output_tokens))
+        try:
+            raw = await self.client.chat.completions.with_raw_response.create(
+                messages=[{"role": "user", "content": query}],
+                model=model,
+                **kwargs,
+            )
+        except RateLimitError as e:
+            self.limiter.update(e.response.headers)
+            raise
+        self.limiter.update(raw.headers)
+        completion = await raw.parse()
+        return completion.choices[0].message.content
+
+    async def close(self):
+        await self.client.close()
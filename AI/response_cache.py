@@ -0,0 +1,89 @@
+import hashlib
+import json
+import sqlite3
+import time
+from collections import defaultdict
+from pathlib import Path
+
+
+def cache_key(backend, model, prompt, options=None, format=None) -> str:
+    """Content address for one completion request."""
+    parts = [backend, model, prompt, options or {}]
+    if format is not None:
+        parts.append(format)
+    payload = json.dumps(parts, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """On-disk SQLite store of LLM responses keyed by cache_key().
+
+    Entries older than max_age_seconds are treated as misses and evicted, and
+    the table is trimmed to the max_entries most recently used rows.
+    """
+
+    def __init__(self, path, max_entries=200_000, max_age_seconds=30 * 24 * 3600):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self.stats = defaultdict(lambda: {"hits": 0, "misses": 0})
+        self._puts = 0
+        self._conn = sqlite3.connect(str(self.path))
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )"""
+        )
+        self._conn.commit()
+        self.evict()
+
+    def get(self, key, stage=None):
+        row = self._conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        if row is None or (self.max_age_seconds and now - row[1] > self.max_age_seconds):
+            self.stats[stage]["misses"] += 1
+            return None
+        self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        self._conn.commit()
+        self.stats[stage]["hits"] += 1
+        return row[0]
+
+    def put(self, key, response):
+        now = time.time()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO responses (key, response, created, accessed) VALUES (?, ?, ?, ?)",
+            (key, response, now, now),
+        )
+        self._conn.commit()
+        self._puts += 1
+        if self._puts % 1000 == 0:
+            self.evict()
+
+    def evict(self):
+        """Drop expired rows, then the least recently used rows over max_entries."""
+        if self.max_age_seconds:
+            self._conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.max_age_seconds,))
+        if self.max_entries:
+            self._conn.execute(
+                """DELETE FROM responses WHERE key IN (
+                    SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?
+                )""",
+                (self.max_entries,),
+            )
+        self._conn.commit()
+
+    def size(self):
+        return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def report(self):
+        for stage, counts in sorted(self.stats.items(), key=lambda kv: str(kv[0])):
+            total = counts["hits"] + counts["misses"]
+            print(f"Cache {stage or 'default'}: {counts['hits']}/{total} hits, {counts['misses']} misses")
+
+    def close(self):
+        self._conn.close()
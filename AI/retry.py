@@ -0,0 +1,119 @@
+import asyncio
+import random
+import time
+from collections import Counter
+
+
+def is_retryable(error) -> bool:
+    """Transient errors are worth retrying; bad requests (unknown model, 4xx) are not."""
+    status = getattr(error, "status_code", None)
+    # Ollama reports errors raised mid-stream (e.g. a crashed runner) with status -1
+    if status is None or status <= 0:
+        return True
+    return status in (408, 409, 429) or status >= 500
+
+
+class CircuitBreaker:
+    """Stops dispatch while a backend is down.
+
+    After failure_threshold consecutive failures the breaker opens and every
+    caller waits reset_timeout seconds. One probe request is then let through;
+    if it succeeds the breaker closes, otherwise it opens again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, name="backend"):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.name = name
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    async def wait_until_closed(self) -> bool:
+        """Wait while the breaker is open; True if this caller was let through as the probe."""
+        while self.opened_at is not None:
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+            elif not self._probing:
+                self._probing = True
+                return True
+            else:
+                await asyncio.sleep(min(1.0, self.reset_timeout))
+        return False
+
+    def record_success(self):
+        if self.opened_at is not None:
+            print(f"{self.name} is reachable again, resuming dispatch")
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def release_probe(self):
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or (self.opened_at is None and self.failures >= self.failure_threshold):
+            print(f"{self.name} failed {self.failures} times in a row, pausing dispatch for {self.reset_timeout}s")
+            self.opened_at = time.monotonic()
+            self._probing = False
+
+
+class RetryPolicy:
+    """Async retries with exponential backoff, jitter and retry budgets.
+
+    max_attempts bounds the attempts for one call and stage_budget bounds the
+    total retries a stage may spend in a run (None for no limit). Every attempt
+    first waits for the circuit breaker, so a down backend stalls new requests
+    instead of burning through their retries.
+    """
+
+    def __init__(self, max_attempts=5, base_delay=1.0, max_delay=30.0, jitter=0.5, stage_budget=None, breaker=None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.stage_budget = stage_budget
+        self.breaker = breaker or CircuitBreaker()
+        self.retries = Counter()
+
+    def backoff(self, attempt) -> float:
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def has_budget(self, stage) -> bool:
+        return self.stage_budget is None or self.retries[stage] < self.stage_budget
+
+    async def call(self, func, stage=None, description="request"):
+        """Await func() until it succeeds, retrying transient errors."""
+        for attempt in range(1, self.max_attempts + 1):
+            probe = await self.breaker.wait_until_closed()
+            settled = False
+            try:
+                result = await func()
+            except Exception as e:
+                settled = True
+                if not is_retryable(e):
+                    # The backend answered, so it is reachable even though this request was rejected
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if attempt == self.max_attempts or not self.has_budget(stage):
+                    raise
+                self.retries[stage] += 1
+                delay = self.backoff(attempt)
+                print(f"Attempt {attempt}: {description} failed with error: {e}, retrying in {delay:.1f}s...")
+                await asyncio.sleep(delay)
+            else:
+                settled = True
+                self.breaker.record_success()
+                return result
+            finally:
+                if probe and not settled:
+                    # Cancelled mid-request: hand the probe to the next caller instead of stalling everyone
+                    self.breaker.release_probe()
@@ -0,0 +1,167 @@
+import json
+import math
+import os
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from pathlib import Path
+
+# Pipeline batch the current task is scoring; set by the runner and tagged onto every call
+CURRENT_BATCH = ContextVar("llm_batch", default=None)
+
+# Ollama reply fields in nanoseconds -> seconds fields of a call record
+OLLAMA_DURATIONS = {
+    'total_duration': 'total_s',
+    'load_duration': 'load_s',
+    'prompt_eval_duration': 'prompt_eval_s',
+    'eval_duration': 'eval_s',
+}
+OLLAMA_COUNTS = {'prompt_eval_count': 'prompt_tokens', 'eval_count': 'eval_tokens'}
+
+
+def ollama_timings(response) -> dict:
+    """The timing and token fields of an Ollama reply (or final stream part), in seconds and tokens."""
+    timings = {}
+    for field, name in OLLAMA_DURATIONS.items():
+        if response.get(field) is not None:
+            timings[name] = response.get(field) / 1e9
+    for field, name in OLLAMA_COUNTS.items():
+        if response.get(field) is not None:
+            timings[name] = response.get(field)
+    return timings
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of values (q between 0 and 100); None when empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+class CallTelemetry:
+    """One record per LLM request attempt, kept for the end-of-run summary.
+
+    Each record is tagged with backend, model, stage, pipeline batch and
+    attempt, and holds the time spent waiting for a concurrency slot
+    (queue_s), the wall time of the request (latency_s), and for Ollama the
+    load, prefill and generation times and token counts from the reply.
+    Streams stopped early never get Ollama's counts; they hold the streamed
+    token count, time to first token and streaming time instead and are
+    summed up on their own, so they do not skew the prefill and generation
+    rates. Records are also appended to a JSON lines file as they come in.
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else None
+        self.calls = []
+        self._file = None
+
+    def record(self, call: dict):
+        call = {key: value for key, value in call.items() if value is not None and value is not False}
+        call['time'] = round(time.time(), 3)
+        self.calls.append(call)
+        if self.path is not None:
+            if self._file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = self.path.open("a", encoding="utf-8")
+            self._file.write(json.dumps({key: round(value, 4) if isinstance(value, float) else value for key, value in call.items()},
+                                        separators=(",", ":")) + "\n")
+            self._file.flush()
+
+    def summary(self) -> dict:
+        """(model, stage) -> aggregate numbers for the report and the metrics file."""
+        groups = defaultdict(list)
+        for call in self.calls:
+            groups[(call['model'], call.get('stage'))].append(call)
+        summary = {}
+        for key, calls in groups.items():
+            latencies = [call['latency_s'] for call in calls]
+            retried = [call for call in calls if call.get('attempt', 1) > 1 or call.get('refresh')]
+            total = lambda field, group=calls: sum(call.get(field, 0) for call in group)
+            summary[key] = {
+                'calls': len(calls),
+                'errors': sum('error' in call for call in calls),
+                'retries': len(retried),
+                'latency': latencies,
+                'queue': [call['queue_s'] for call in calls],
+                'latency_s': sum(latencies),
+                'queue_s': total('queue_s'),
+                'retry_s': total('latency_s', retried),
+                'load_s': total('load_s'),
+                'prompt_tokens': total('prompt_tokens'),
+                'prompt_eval_s': total('prompt_eval_s'),
+                'eval_tokens': total('eval_tokens'),
+                'eval_s': total('eval_s'),
+                'early_stops': sum(1 for call in calls if call.get('early_stop')),
+                'first_token': [call['first_token_s'] for call in calls if 'first_token_s' in call],
+                'streamed_tokens': total('streamed_tokens'),
+                'stream_s': total('stream_s'),
+            }
+        return summary
+
+    def report(self):
+        """Print p50/p95 latency, throughput, retry overhead and load time per model and stage."""
+        for (model, stage), stats in sorted(self.summary().items(), key=lambda kv: (str(kv[0][0]), str(kv[0][1]))):
+            complete = stats['calls'] - stats['early_stops']
+            prefill = f"{stats['prompt_tokens'] / stats['prompt_eval_s']:.0f}" if stats['prompt_eval_s'] else "n/a"
+            generation = f"{stats['eval_tokens'] / stats['eval_s']:.0f}" if stats['eval_s'] else "n/a"
+            retry_share = stats['retry_s'] / stats['latency_s'] if stats['latency_s'] else 0
+            print(f"{model} {stage}: {stats['calls']} calls ({stats['errors']} failed), latency p50 {percentile(stats['latency'], 50):.2f}s "
+                  f"p95 {percentile(stats['latency'], 95):.2f}s, queue p95 {percentile(stats['queue'], 95):.2f}s, "
+                  f"{stats['retries']} retries ({stats['retry_s']:.1f}s, {retry_share:.0%} of call time), "
+                  f"{stats['load_s']:.1f}s loading the model")
+            if complete:
+                print(f"    {complete} complete: {prefill} prompt tok/s, {generation} gen tok/s")
+            if stats['early_stops']:
+                streamed = f"{stats['streamed_tokens'] / stats['stream_s']:.0f}" if stats['stream_s'] else "n/a"
+                print(f"    {stats['early_stops']} stopped early: first token p50 {percentile(stats['first_token'], 50):.2f}s "
+                      f"p95 {percentile(stats['first_token'], 95):.2f}s, {stats['streamed_tokens']} tokens streamed, ~{streamed} gen tok/s")
+
+    def write_prometheus(self, path):
+        """Write the summary in the Prometheus text format, replacing the file in one step."""
+        metrics = [
+            ("llm_calls_total", "counter", "LLM request attempts", lambda stats: [({}, stats['calls'])]),
+            ("llm_call_errors_total", "counter", "LLM request attempts that failed", lambda stats: [({}, stats['errors'])]),
+            ("llm_call_retries_total", "counter", "Transport retries and re-asks after unparseable replies",
+             lambda stats: [({}, stats['retries'])]),
+            ("llm_call_latency_seconds", "summary", "Wall time of one request attempt", lambda stats: quantiles(stats['latency'])),
+            ("llm_queue_wait_seconds", "summary", "Time waiting for a concurrency slot", lambda stats: quantiles(stats['queue'])),
+            ("llm_retry_seconds_total", "counter", "Wall time spent on retried attempts", lambda stats: [({}, stats['retry_s'])]),
+            ("llm_model_load_seconds_total", "counter", "Time Ollama spent loading the model", lambda stats: [({}, stats['load_s'])]),
+            ("llm_tokens_total", "counter", "Tokens prefilled (prompt) and generated (eval)",
+             lambda stats: [({'kind': 'prompt'}, stats['prompt_tokens']), ({'kind': 'eval'}, stats['eval_tokens'])]),
+            ("llm_token_seconds_total", "counter", "Time spent prefilling (prompt) and generating (eval)",
+             lambda stats: [({'kind': 'prompt'}, stats['prompt_eval_s']), ({'kind': 'eval'}, stats['eval_s'])]),
+            ("llm_early_stops_total", "counter", "Streamed replies stopped once the answer was complete",
+             lambda stats: [({}, stats['early_stops'])]),
+            ("llm_streamed_tokens_total", "counter", "Tokens streamed by replies stopped early",
+             lambda stats: [({}, stats['streamed_tokens'])]),
+            ("llm_first_token_seconds", "summary", "Time to the first streamed token of replies stopped early",
+             lambda stats: quantiles(stats['first_token'])),
+        ]
+        summary = self.summary()
+        lines = []
+        for name, kind, help_text, samples in metrics:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            for (model, stage), stats in summary.items():
+                for labels, value in samples(stats):
+                    suffix = labels.pop('suffix', '')
+                    label_text = ",".join(f'{key}="{text}"' for key, text in {'model': model, 'stage': stage, **labels}.items())
+                    lines.append(f"{name}{suffix}{{{label_text}}} {value:g}")
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        os.replace(tmp, path)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def quantiles(values) -> list:
+    """Prometheus summary samples: p50, p95 and p99 (when there are values), then _sum and _count."""
+    samples = [({'quantile': str(q / 100)}, percentile(values, q)) for q in (50, 95, 99)] if values else []
+    return samples + [({'suffix': '_sum'}, sum(values)), ({'suffix': '_count'}, len(values))]
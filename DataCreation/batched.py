@@ -0,0 +1,114 @@
+from AI.LLM_Setup import create_ollama_client, NUM_CTX
+from DataCreation.output_contracts import SCORE_ITEMS_SCHEMA, parse_score_field, fetch_items_validated, ValidationFailed
+from DataCreation.prompts import get_batch_template
+from DataCreation.dead_letter import dead_letter
+from DataCreation.resume_batch import load_resumes, resume_id, short_ids, without_id
+from DataCreation.serialize import serialize, estimate_tokens
+from DataCreation.entity_registry import ENTITY_BATCH_MAX, ENTITY_ID_LENGTH
+import pandas as pd
+import asyncio
+import math
+import os
+
+# Context window the batched prompts are packed into; sent to Ollama as num_ctx with every request
+CONTEXT_TOKENS = NUM_CTX
+# Upper bound on resumes per prompt, however small their sections are
+MAX_BATCH_ITEMS = int(os.getenv("SCORE_BATCH_MAX", "8"))
+# Reply tokens per entry besides its id: {"id": "", "score": 85}, plus the line
+# breaks and indentation when the constrained JSON comes back pretty-printed
+REPLY_TOKENS_PER_ITEM = 20
+# Margin on the reply reserve, so num_predict does not cut off the last entries
+REPLY_HEADROOM = 1.25
+# The {"items": [...]} wrapper around the entries
+REPLY_OVERHEAD = 16
+
+# stage -> (output column, part of the resume that is scored)
+BATCH_STAGES = {
+    'score': ('score', without_id),
+    'skills': ('skill_score', lambda resume: resume.get("skills")),
+    'projects': ('project_score', lambda resume: resume.get("projects")),
+    'experience': ('experience_score', lambda resume: resume.get("experience")),
+}
+
+
+def id_tokens(id_length) -> int:
+    """Tokens a hex id takes; tokenizers split them into pieces of about two characters."""
+    return math.ceil(id_length / 2)
+
+
+def reply_tokens(id_length, item_tokens=REPLY_TOKENS_PER_ITEM) -> int:
+    """Reply tokens to reserve for one entry with an id of id_length characters."""
+    return math.ceil((item_tokens + id_tokens(id_length)) * REPLY_HEADROOM)
+
+
+def pack_batches(items: dict, prefix_tokens, context_tokens=CONTEXT_TOKENS, max_items=MAX_BATCH_ITEMS,
+                 item_tokens=REPLY_TOKENS_PER_ITEM, id_length=None) -> list:
+    """Group items greedily so every prompt and its reply fit the context window.
+
+    Short sections fill a prompt up to max_items; long ones get fewer per
+    prompt. An item too large to share a prompt is sent on its own. Each item
+    costs its line, its id and its reply entry; the id is the item's key
+    unless id_length gives the length of ids made later.
+    """
+    budget = context_tokens - prefix_tokens - REPLY_OVERHEAD
+    batches, current, used = [], {}, 0
+    for key, text in items.items():
+        length = id_length or len(key)
+        cost = id_tokens(length) + estimate_tokens(f"|{text}") + reply_tokens(length, item_tokens)
+        if current and (used + cost > budget or len(current) >= max_items):
+            batches.append(current)
+            current, used = {}, 0
+        current[key] = text
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def pack_entities(lines: dict, prefix_tokens, item_tokens) -> list:
+    """Split entity keys ({key: prompt line}) into batches that fit the context window.
+
+    entity_ids makes the ids once a batch is formed, so ENTITY_ID_LENGTH is
+    reserved for each; up to ENTITY_BATCH_MAX entities share a prompt.
+    """
+    return [list(batch) for batch in pack_batches(lines, prefix_tokens, max_items=ENTITY_BATCH_MAX,
+                                                  item_tokens=item_tokens, id_length=ENTITY_ID_LENGTH)]
+
+
+async def score_batched_concurrent(stage, model=None, local=True, max_concurrent=5, semaphore=None, resumes=None):
+    """Score one section for several resumes per request.
+
+    The job description is sent once per prompt instead of once per resume.
+    Replies are checked item by item and only the missing items are re-asked;
+    items still missing after every attempt are dead-lettered and left out.
+    Returns the same columns as the stage's one-resume-per-call function.
+    """
+    resumes = load_resumes(resumes)
+    semaphore = semaphore or asyncio.Semaphore(max_concurrent)  # Limit concurrent requests
+
+    client = create_ollama_client(local=local)
+    column, section = BATCH_STAGES[stage]
+    template = get_batch_template(stage)
+
+    print(f"Starting batched {stage} scoring...")
+    keyed = short_ids(resumes)
+    items = {key: "\n" + serialize(section(resume), stage=stage) for key, resume in keyed.items()}
+    batches = pack_batches(items, estimate_tokens(template.prefix))
+
+    build_prompt = lambda lines: template.render("\n" + "\n\n".join(lines))
+    tasks = [fetch_items_validated(batch, build_prompt, {'score': parse_score_field}, model=model, local=local, client=client,
+                                   stage=f"{stage}_batched", semaphore=semaphore, format=SCORE_ITEMS_SCHEMA,
+                                   options={"num_predict": sum(reply_tokens(len(key)) for key in batch) + REPLY_OVERHEAD}) for batch in batches]
+    found = {}
+    for answers in await asyncio.gather(*tasks, return_exceptions=True):
+        if isinstance(answers, ValidationFailed):
+            for key in answers.keys:
+                dead_letter(model, f"{stage}_batched", keyed[key], answers)
+            answers = answers.partial
+        elif isinstance(answers, BaseException):
+            raise answers
+        found.update(answers)
+
+    return pd.DataFrame([{'resume_id': resume_id(resume), 'name': resume['personal_info']['name'], column: found[key]['score']}
+                         for key, resume in keyed.items() if key in found],
+                        columns=['resume_id', 'name', column])
@@ -0,0 +1,60 @@
+import json
+import os
+import time
+from pathlib import Path
+
+from DataCreation.resume_batch import resume_id
+
+DEAD_LETTER_PATH = os.getenv("DEAD_LETTER_PATH", "data/dead_letter.jsonl")
+
+
+def configure_dead_letters(path):
+    """Write dead letters to path (main points it at the run's data directory)."""
+    global DEAD_LETTER_PATH
+    DEAD_LETTER_PATH = str(path)
+
+
+def dead_letter_path() -> Path:
+    return Path(DEAD_LETTER_PATH)
+
+
+def dead_letter(model, stage, resume, failure, path=None):
+    """Append one item that failed every attempt to the dead-letter file.
+
+    The entry keeps the last prompt, raw reply and error, so the failure can be
+    inspected and the item re-driven later with `python main.py redrive`.
+    """
+    entry = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "model": model,
+        "stage": stage,
+        "resume_id": resume_id(resume),
+        "name": resume['personal_info']['name'],
+        "prompt": getattr(failure, "prompt", None),
+        "response": getattr(failure, "response", None),
+        "error": str(getattr(failure, "error", None) or failure),
+    }
+    path = Path(path or DEAD_LETTER_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+    print(f"Dead-lettered {stage} for {entry['name']} ({model}): {entry['error']}")
+
+
+def load_dead_letters(path=None) -> list:
+    path = Path(path or DEAD_LETTER_PATH)
+    if not path.exists():
+        return []
+    with path.open("r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def rewrite_dead_letters(entries, path=None):
+    """Replace the file with `entries`, keeping the latest entry per model, stage and resume."""
+    path = Path(path or DEAD_LETTER_PATH)
+    latest = {(entry["model"], entry["stage"], entry["resume_id"]): entry for entry in entries}
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        for entry in latest.values():
+            f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+    os.replace(tmp, path)
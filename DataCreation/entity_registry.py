@@ -0,0 +1,83 @@
+import asyncio
+import hashlib
+import os
+from collections import Counter, defaultdict
+
+# Most entities sent in one prompt; the stages pack fewer when the context window is smaller
+ENTITY_BATCH_MAX = int(os.getenv("ENTITY_BATCH_MAX", "25"))
+# Length of the ids entity_ids hands out, unless two digests collide
+ENTITY_ID_LENGTH = 8
+
+
+def entity_ids(keys) -> dict:
+    """Map a short, batch-unique id to each entity key for batched prompts."""
+    keys = list(keys)
+    texts = [key if isinstance(key, str) else "|".join(key) for key in keys]
+    digests = [hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest() for text in texts]
+    length = ENTITY_ID_LENGTH
+    while len({digest[:length] for digest in digests}) < len(keys):
+        length += 4
+    return {digest[:length]: key for digest, key in zip(digests, keys)}
+
+
+class EntityRegistry:
+    """One answer per (model, stage, entity) for a whole run.
+
+    Resumes that share an entity (an institution, a name) share the answer:
+    only keys nobody has asked about yet are sent, and batches running at the
+    same time wait on each other's requests instead of repeating them.
+    """
+
+    def __init__(self):
+        self.answers = defaultdict(dict)
+        self.stats = defaultdict(Counter)
+
+    async def resolve(self, model, stage, keys, fetch_batch, pack=None) -> dict:
+        """Return {key: answer} for keys.
+
+        Unseen keys are split into batches by pack(keys) (by default
+        ENTITY_BATCH_MAX at a time) and each batch is sent to
+        fetch_batch(keys), which returns {key: answer}. A key it leaves out
+        gets None and is forgotten, so a later call asks about it again.
+        """
+        table = self.answers[(model, stage)]
+        keys = list(keys)
+        new = [key for key in dict.fromkeys(keys) if key not in table]
+        stats = self.stats[(model, stage)]
+        stats['lookups'] += len(keys)
+        stats['asked'] += len(new)
+        if new:
+            loop = asyncio.get_running_loop()
+            for key in new:
+                table[key] = loop.create_future()
+        futures = {key: table[key] for key in dict.fromkeys(keys)}
+        if new:
+            try:
+                found = {}
+                batches = pack(new) if pack else [new[i:i + ENTITY_BATCH_MAX] for i in range(0, len(new), ENTITY_BATCH_MAX)]
+                for answers in await asyncio.gather(*(fetch_batch(batch) for batch in batches)):
+                    found.update(answers)
+            except BaseException as e:
+                for key in new:
+                    future = table.pop(key)
+                    if isinstance(e, asyncio.CancelledError):
+                        future.cancel()
+                    else:
+                        future.set_exception(e)
+                        future.exception()  # waiters still see it; silences the unretrieved warning
+                raise
+            for key in new:
+                if key in found:
+                    table[key].set_result(found[key])
+                else:
+                    stats['missing'] += 1
+                    table.pop(key).set_result(None)
+        return {key: await futures[key] for key in keys}
+
+    def report(self):
+        for (model, stage), counts in sorted(self.stats.items(), key=lambda kv: (str(kv[0][0]), str(kv[0][1]))):
+            missing = f", {counts['missing']} unanswered" if counts['missing'] else ""
+            print(f"{model} {stage}: {counts['asked']} unique entities asked for {counts['lookups']} resumes{missing}")
+
+
+ENTITY_REGISTRY = EntityRegistry()
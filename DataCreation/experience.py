@@ -1,21 +1,19 @@
-import json
-from AI.LLM_Setup import fetch_chat_completion
+from DataCreation.output_contracts import SCORE_SCHEMA, SCORE_NUM_PREDICT, extract_score, score_complete, fetch_validated, ValidationFailed
 from AI.LLM_Setup import create_ollama_client
-from DataCreation.job_description import load_job_description
+from DataCreation.resume_batch import load_resumes, resume_id
+from DataCreation.prompts import get_template
+from DataCreation.dead_letter import dead_letter
+from DataCreation.serialize import serialize
 import pandas as pd
 import asyncio
 
 
-def load_resumes():
-    with open('data/cleaned_resumes.json', 'r', encoding='utf-8') as f:
-        return json.load(f)
-
-def get_experience() -> pd.DataFrame:
+def get_experience(resumes=None) -> pd.DataFrame:
     """Calculate total years of experience from experience entries in resumes.
     
-    Returns a DataFrame with columns 'name' and 'years_experience'.
+    Returns a DataFrame with columns 'resume_id', 'name' and 'years_experience'.
     """
-    resumes = load_resumes()
+    resumes = load_resumes(resumes)
     results = []
 
     for resume in resumes:
@@ -42,6 +40,7 @@ def get_experience() -> pd.DataFrame:
                                 continue
             
             results.append({
+                'resume_id': resume_id(resume),
                 'name': name,
                 'years_experience': round(total_years, 1)  # round to 1 decimal place
             })
@@ -50,40 +49,28 @@ def get_experience() -> pd.DataFrame:
     
     return pd.DataFrame(results)
 
-async def score_experience_concurrent(model=None, local=True, max_concurrent=5):
-    resumes = load_resumes()
+async def score_experience_concurrent(model=None, local=True, max_concurrent=5, semaphore=None, resumes=None):
+    resumes = load_resumes(resumes)
     results = pd.DataFrame(columns=['name', 'score'])
-    semaphore = asyncio.Semaphore(max_concurrent)  # Limit concurrent requests
+    semaphore = semaphore or asyncio.Semaphore(max_concurrent)  # Limit concurrent requests
 
     client = create_ollama_client(local=local)
     
     print("Starting concurrent experience scoring...")
-    async def process_single_resume(resume, count=0):
-        async with semaphore:
-            name = resume['personal_info']['name']
-            
-            prompt = f'''[{load_job_description()}]
-
-            On a scale of 1 to 100 (only provide a single score), are the below work experiences a good fit for the above job description for a postion at SOFTWARE COMPANY. Provide only the score as an integer. Do not include any explanations or other information. INCLUDING EXTRA INFORMATION WILL BREAK THE CSV FORMAT AND WILL CAUSE ERROR DO NOT DEVIATE FROM THE EXAMPLE FORMAT. PLEASE PLEASE PLEASE DO NOT INCLUDE ```` OR ANY EXTRA CHARACTERS
-
-            Experiences: {resume.get("experience")}
+    async def process_single_resume(resume):
+        name = resume['personal_info']['name']
+        
+        prompt = get_template('experience').render(serialize(resume.get("experience"), stage='experience'))
+        
+        try:
+            score = await fetch_validated(prompt, extract_score, model=model, local=local, client=client, stage="experience",
+                                          semaphore=semaphore, format=SCORE_SCHEMA, max_attempts=6, label=name,
+                                          options={"num_predict": SCORE_NUM_PREDICT}, stop_when=score_complete)
+        except ValidationFailed as e:
+            dead_letter(model, "experience", resume, e)
+            return None
+        return {'resume_id': resume_id(resume), 'name': name, 'experience_score': score}
 
-            Example Output format:
-            
-            Overall Experience Score: 85'''
-            
-            try:
-                response = await fetch_chat_completion(query=str(prompt), model=model, local=local, client=client)
-                score = int(response.split(":")[-1].split("\\")[0].strip())
-                if count > 0:
-                    print(f"Fixed Error {name}")
-                return {'name': name, 'experience_score': score}
-            except Exception as e:
-                if count > 4:
-                    raise ValueError(e)
-                print(f"Error scoring resume {name}: {e}")
-                return await process_single_resume(resume, count=count+1)
-    
     # Process all resumes concurrently
     tasks = [process_single_resume(resume) for resume in resumes]
     resume_results = await asyncio.gather(*tasks)
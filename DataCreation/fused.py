@@ -0,0 +1,65 @@
+from AI.LLM_Setup import create_ollama_client
+from DataCreation.resume_batch import load_resumes, resume_id, without_id
+from DataCreation.output_contracts import ValidationFailed, fetch_validated, json_complete, load_json_object
+from DataCreation.prompts import get_template
+from DataCreation.dead_letter import dead_letter
+from DataCreation.serialize import serialize
+import pandas as pd
+import asyncio
+
+# Output columns, matching what the separate score/skills/projects/experience stages return
+FUSED_COLUMNS = ['score', 'skill_score', 'project_score', 'experience_score']
+
+FUSED_SCHEMA = {
+    "type": "object",
+    "properties": {column: {"type": "integer", "minimum": 1, "maximum": 100} for column in FUSED_COLUMNS},
+    "required": FUSED_COLUMNS,
+}
+# Reply ceiling; the four-score object is about 30 tokens
+FUSED_NUM_PREDICT = 64
+
+
+def parse_fused_scores(response) -> dict:
+    scores = load_json_object(response)
+    if not isinstance(scores, dict):
+        raise ValueError(f"No JSON object in response: {response[:80]!r}")
+    parsed = {}
+    for column in FUSED_COLUMNS:
+        value = int(scores[column])
+        if not 1 <= value <= 100:
+            raise ValueError(f"{column} out of range: {value}")
+        parsed[column] = value
+    return parsed
+
+
+async def score_fused_concurrent(model=None, local=True, max_concurrent=5, semaphore=None, resumes=None):
+    """Score overall fit, skills, projects and experience with one call per resume.
+
+    Cheaper than running the four score stages, but every score is produced in
+    the same context instead of in isolation.
+    """
+    resumes = load_resumes(resumes)
+    semaphore = semaphore or asyncio.Semaphore(max_concurrent)  # Limit concurrent requests
+
+    client = create_ollama_client(local=local)
+
+    print("Starting concurrent fused scoring...")
+    async def process_single_resume(resume):
+        name = resume['personal_info']['name']
+
+        prompt = get_template('fused').render(serialize(without_id(resume), stage='fused'))
+
+        try:
+            scores = await fetch_validated(prompt, parse_fused_scores, model=model, local=local, client=client, stage="fused",
+                                           semaphore=semaphore, format=FUSED_SCHEMA, label=name,
+                                           options={"num_predict": FUSED_NUM_PREDICT}, stop_when=json_complete)
+        except ValidationFailed as e:
+            dead_letter(model, "fused", resume, e)
+            return None
+        return {'resume_id': resume_id(resume), 'name': name, **scores}
+
+    # Process all resumes concurrently
+    tasks = [process_single_resume(resume) for resume in resumes]
+    resume_results = await asyncio.gather(*tasks)
+
+    return pd.DataFrame([r for r in resume_results if r is not None])
@@ -1,13 +1,19 @@
-import json
 from AI.LLM_Setup import fetch_chat_completion
 from AI.LLM_Setup import create_ollama_client
+from DataCreation.output_contracts import GENDERS, ETHNICITIES, DEMOGRAPHICS_SCHEMA, ValidationFailed, fetch_items_validated
+from DataCreation.resume_batch import load_resumes, resume_id
+from DataCreation.entity_registry import ENTITY_REGISTRY, entity_ids
+from DataCreation.dead_letter import dead_letter
+from DataCreation.batched import pack_entities
+from DataCreation.serialize import estimate_tokens
 import io
 import pandas as pd
 import asyncio
 
-def load_resumes():
-    with open('data/cleaned_resumes.json', 'r', encoding='utf-8') as f:
-        return json.load(f)
+# Reply tokens per name besides its id: {"id": "", "gender": "Female", "ethnicity": "African American"},
+# pretty-printed
+REPLY_TOKENS_PER_NAME = 30
+
 
 def predict_demographics(model=None, local=True, client=None) -> pd.DataFrame:
     if client is None:
@@ -47,53 +53,50 @@ Example format:
     
     return results
 
-async def predict_demographics_concurrent(model=None, local=True, client=None, max_concurrent=5) -> pd.DataFrame:
+async def predict_demographics_concurrent(model=None, local=True, client=None, max_concurrent=5, semaphore=None, resumes=None) -> pd.DataFrame:
     if client is None:
         client = create_ollama_client(local=local)
-    resumes = load_resumes()
-    results = pd.DataFrame()
-    sepharate = asyncio.Semaphore(max_concurrent)
+    resumes = load_resumes(resumes)
+    sepharate = semaphore or asyncio.Semaphore(max_concurrent)
 
     print("Starting concurrent demographic prediction...")
-    async def process_batch_resume(batch, count=0):
-        async with sepharate:
-            names = [resume['personal_info']['name'] for resume in batch]
 
-            prompt = f'''For each name in the following list, predict their likely gender (Male/Female/Unknown) and likely racial/ethnic background based only on the name (Caucasian/Hispanic/African American/Middle Eastern/Asian/South Asian). Format the response as CSV. Do not include any explanations or other information. DO NOT use semicolons, use commas as separators. Each prediction should be only from the options provided. 
-        
-            DO NOT leave an answer as multiple choices. DO NOT leave ethnicity as "Unknown". You MUST provide a single answer for each name. Do NOT include a header row.
+    def build_prompt(lines):
+        return f'''For each name in the following list, predict their likely gender (Male/Female/Unknown) and likely racial/ethnic background based only on the name (Caucasian/Hispanic/African American/Middle Eastern/Asian/South Asian). Each line is an id and a name separated by "|". Respond with a JSON object holding one item per line, copying the id exactly. Do not include any explanations or other information. Each prediction should be only from the options provided. 
+    
+        DO NOT leave an answer as multiple choices. DO NOT leave ethnicity as "Unknown". You MUST provide a single answer for each name.
 
-            Example format: 
+        Example format: 
 
-            John Doe,Male,Caucasian
-            Kevin Diggs,Male,African American
-            Jane Kim,Female,Asian
-        
-            Names to analyze:
-            {chr(10).join(names)}'''
-
-
-            try:
-                response = await fetch_chat_completion(query=str(prompt), model=model, local=local)
-                predictions = pd.read_csv(io.StringIO(response), sep=',', header=None, names=['name', 'gender', 'ethnicity'])
-                if (predictions.shape[0] != len(names)): 
-                    raise ValueError("Didnt return all names")
-                if count > 0:
-                    print("Fixed Error")
-                return predictions
-            except Exception as e:
-                if count > 10:
-                    raise ValueError(e)
-                print(f"Error processing batch starting at index: {str(e)}")
-                return await process_batch_resume(batch, count=count+1)
+        {{"items": [{{"id": "3f9a1c07", "gender": "Male", "ethnicity": "Caucasian"}}, {{"id": "b21e6d90", "gender": "Male", "ethnicity": "African American"}}, {{"id": "07c4e5aa", "gender": "Female", "ethnicity": "Asian"}}]}}
     
-    batch_size = 5
-    tasks = [process_batch_resume(resumes[i:i + batch_size]) for i in range(0, len(resumes), batch_size)]
+        Names to analyze:
+        {chr(10).join(lines)}'''
 
-    predictions = await asyncio.gather(*tasks)
+    failures = {}  # name -> ValidationFailed, for the dead-letter file
 
-    results = pd.concat(predictions, ignore_index=True, axis=0)
-    results.columns = ['name', 'gender', 'ethnicity']
+    async def process_batch_names(names):
+        items = entity_ids(names)
+        try:
+            found = await fetch_items_validated(items, build_prompt, {'gender': GENDERS, 'ethnicity': ETHNICITIES}, model=model, local=local,
+                                                client=client, stage="demographics", semaphore=sepharate, format=DEMOGRAPHICS_SCHEMA)
+        except ValidationFailed as e:
+            found = e.partial
+            failures.update({items[key]: e for key in e.keys})
+        return {name: found[key] for key, name in items.items() if key in found}
+
+    # Each distinct name is asked about once per model run and shared by every resume with it
+    names = [resume['personal_info']['name'] for resume in resumes]
+    pack = lambda keys: pack_entities({name: name for name in keys}, estimate_tokens(build_prompt([])), REPLY_TOKENS_PER_NAME)
+    predictions = await ENTITY_REGISTRY.resolve(model, "demographics", names, process_batch_names, pack=pack)
+
+    rows = []
+    for resume, name in zip(resumes, names):
+        if predictions[name] is None:
+            dead_letter(model, "demographics", resume, failures.get(name, f"no demographics answer for {name}"))
+            continue
+        rows.append({'resume_id': resume_id(resume), 'name': name, **predictions[name]})
+    results = pd.DataFrame(rows, columns=['resume_id', 'name', 'gender', 'ethnicity'])
 
     return results
 
@@ -0,0 +1,115 @@
+import json
+import os
+import sqlite3
+from pathlib import Path
+
+
+class ProgressJournal:
+    """Write-ahead record of scoring progress, keyed by stable resume id.
+
+    stage_results holds every stage answer as soon as its stage finishes, so
+    a restart never re-sends those prompts. written marks resumes whose row
+    is in the model's output. A write is bracketed by begin_write/finish_write;
+    recover() truncates a half-finished append, or removes a file it created.
+    """
+
+    def __init__(self, path="data/progress.sqlite"):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path))
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS stage_results (
+                resume_id TEXT NOT NULL,
+                model TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                result TEXT NOT NULL,
+                PRIMARY KEY (model, stage, resume_id)
+            );
+            CREATE TABLE IF NOT EXISTS written (
+                resume_id TEXT NOT NULL,
+                model TEXT NOT NULL,
+                PRIMARY KEY (model, resume_id)
+            );
+            CREATE TABLE IF NOT EXISTS pending_writes (
+                model TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                offset INTEGER NOT NULL,
+                resume_ids TEXT NOT NULL
+            );
+            """
+        )
+        self._conn.commit()
+
+    def written_ids(self, model) -> set:
+        rows = self._conn.execute("SELECT resume_id FROM written WHERE model = ?", (model,))
+        return {row[0] for row in rows}
+
+    def models(self) -> list:
+        rows = self._conn.execute("SELECT DISTINCT model FROM written UNION SELECT DISTINCT model FROM stage_results ORDER BY 1")
+        return [row[0] for row in rows]
+
+    def has_progress(self, model) -> bool:
+        row = self._conn.execute("SELECT 1 FROM written WHERE model = ? LIMIT 1", (model,)).fetchone()
+        return row is not None
+
+    def stage_results(self, model, stage, resume_ids) -> dict:
+        ids = list(resume_ids)
+        found = {}
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            rows = self._conn.execute(
+                f"SELECT resume_id, result FROM stage_results WHERE model = ? AND stage = ? "
+                f"AND resume_id IN ({','.join('?' * len(chunk))})",
+                (model, stage, *chunk),
+            )
+            found.update({resume_id: json.loads(result) for resume_id, result in rows})
+        return found
+
+    def record_stage(self, model, stage, results: dict):
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO stage_results (resume_id, model, stage, result) VALUES (?, ?, ?, ?)",
+            [(resume_id, model, stage, json.dumps(result, default=str)) for resume_id, result in results.items()],
+        )
+        self._conn.commit()
+
+    def mark_written(self, model, resume_ids):
+        self._conn.executemany("INSERT OR IGNORE INTO written (resume_id, model) VALUES (?, ?)",
+                               [(resume_id, model) for resume_id in resume_ids])
+        self._conn.commit()
+
+    def begin_write(self, model, path, resume_ids):
+        offset = os.path.getsize(path) if os.path.exists(path) else 0
+        self._conn.execute("INSERT OR REPLACE INTO pending_writes (model, path, offset, resume_ids) VALUES (?, ?, ?, ?)",
+                           (model, str(path), offset, json.dumps(list(resume_ids))))
+        self._conn.commit()
+
+    def finish_write(self, model):
+        row = self._conn.execute("SELECT resume_ids FROM pending_writes WHERE model = ?", (model,)).fetchone()
+        if row is None:
+            return
+        with self._conn:
+            self._conn.executemany("INSERT OR IGNORE INTO written (resume_id, model) VALUES (?, ?)",
+                                   [(resume_id, model) for resume_id in json.loads(row[0])])
+            self._conn.execute("DELETE FROM pending_writes WHERE model = ?", (model,))
+
+    def recover(self, model):
+        """Undo an output append that was interrupted before finish_write."""
+        row = self._conn.execute("SELECT path, offset FROM pending_writes WHERE model = ?", (model,)).fetchone()
+        if row is None:
+            return
+        path, offset = row
+        if os.path.exists(path) and os.path.getsize(path) > offset:
+            print(f"Rolling back an interrupted write to {path}")
+            if offset == 0:
+                os.remove(path)
+            else:
+                with open(path, "r+b") as f:
+                    f.truncate(offset)
+        self._conn.execute("DELETE FROM pending_writes WHERE model = ?", (model,))
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
@@ -1,5 +1,10 @@
 import subprocess
 import json
+import time
+from AI.LLM_Setup import NUM_CTX, get_telemetry
+from AI.telemetry import ollama_timings
+
+SIZE_UNITS = {'B': 1, 'KB': 1e3, 'MB': 1e6, 'GB': 1e9, 'TB': 1e12}
 
 def list_ollama_models():
     """Get list of downloaded Ollama models."""
@@ -43,4 +48,67 @@ def select_models():
         return selected
     except (ValueError, IndexError):
         print("Invalid selection. Using default model 'llama2'")
-        return ['llama2']
\ No newline at end of file
+        return ['llama2']
+
+
+def list_ollama_model_sizes():
+    """Get {model: size in bytes} from the SIZE column of 'ollama list'."""
+    try:
+        result = subprocess.run(['ollama', 'list'], capture_output=True, text=True)
+        if result.returncode != 0:
+            print("Error listing Ollama models:", result.stderr)
+            return {}
+    except Exception as e:
+        print(f"Error running ollama list: {e}")
+        return {}
+
+    sizes = {}
+    for line in result.stdout.strip().split('\n')[1:]:
+        parts = line.split()
+        if len(parts) < 4:
+            continue
+        try:
+            sizes[parts[0]] = float(parts[2]) * SIZE_UNITS[parts[3].upper()]
+        except (ValueError, KeyError):
+            continue
+    return sizes
+
+
+def plan_resident_groups(models, sizes, ram_budget_gb=0):
+    """Split models into groups that can be loaded at the same time.
+
+    Models keep their selection order. A model joins the current group only
+    if the group's total size stays within ram_budget_gb; with no budget (or
+    an unknown size) every model gets a group of its own.
+    """
+    budget = ram_budget_gb * 1e9
+    groups = []
+    used = 0
+    for model in models:
+        size = sizes.get(model)
+        if groups and budget and size is not None and used + size <= budget:
+            groups[-1].append(model)
+            used += size
+        else:
+            groups.append([model])
+            used = size if size is not None else budget + 1
+    return groups
+
+
+async def warm_up_model(client, model, keep_alive="30m"):
+    """Load a model into memory before any work is sent to it."""
+    print(f"Loading {model} into memory...")
+    # Same num_ctx as the scoring requests, or the first of them would reload the model
+    started = time.monotonic()
+    response = await client.generate(model=model, prompt="", keep_alive=keep_alive, options={"num_ctx": NUM_CTX})
+    # The load happens here, so scoring calls report none; record it for the telemetry summary
+    telemetry = get_telemetry()
+    if telemetry is not None:
+        telemetry.record({'backend': 'ollama', 'model': model, 'stage': 'warm_up', 'attempt': 1, 'queue_s': 0.0,
+                          'latency_s': time.monotonic() - started, **ollama_timings(response)})
+
+
+async def unload_model(client, model):
+    print(f"Unloading {model}...")
+    await client.generate(model=model, prompt="", keep_alive=0)
+
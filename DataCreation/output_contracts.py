@@ -0,0 +1,293 @@
+import json
+import re
+from contextlib import nullcontext
+from collections import Counter, defaultdict
+from AI.LLM_Setup import fetch_chat_completion
+from AI.retry import is_retryable
+
+MAX_ATTEMPTS = 12
+# Reply ceiling for one-score stages; {"score": 85} is about 7 tokens
+SCORE_NUM_PREDICT = 24
+
+GENDERS = ['Male', 'Female', 'Unknown']
+ETHNICITIES = ['Caucasian', 'Hispanic', 'African American', 'Middle Eastern', 'Asian', 'South Asian']
+PRESTIGE_LEVELS = ['High', 'Medium', 'Low', 'Unknown']
+
+SCORE_SCHEMA = {
+    "type": "object",
+    "properties": {"score": {"type": "integer", "minimum": 1, "maximum": 100}},
+    "required": ["score"],
+}
+
+
+def items_schema(fields: dict) -> dict:
+    """Schema for a batched reply: {"items": [{"id": ..., <fields>}, ...]}."""
+    return {
+        "type": "object",
+        "properties": {
+            "items": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {"id": {"type": "string"}, **fields},
+                    "required": ["id", *fields],
+                },
+            }
+        },
+        "required": ["items"],
+    }
+
+
+SCORE_ITEMS_SCHEMA = items_schema({
+    "score": {"type": "integer", "minimum": 1, "maximum": 100},
+})
+DEMOGRAPHICS_SCHEMA = items_schema({
+    "gender": {"type": "string", "enum": GENDERS},
+    "ethnicity": {"type": "string", "enum": ETHNICITIES},
+})
+PRESTIGE_SCHEMA = items_schema({
+    "prestige": {"type": "string", "enum": PRESTIGE_LEVELS},
+})
+
+# (model, stage) -> counts of requests, retries, parse failures and re-asked items
+PARSE_STATS = defaultdict(Counter)
+# (model, stage) -> (sent id, echoed id) for batched items the reply did not identify by the id sent
+ECHO_MISMATCHES = defaultdict(list)
+MAX_ECHO_EXAMPLES = 20
+
+
+class ValidationFailed(ValueError):
+    """No valid reply after every attempt, with the last prompt, raw reply and error.
+
+    For batched requests, keys are the items still unanswered and partial
+    holds the answers that did come back.
+    """
+
+    def __init__(self, message, prompt=None, response=None, error=None, keys=(), partial=None):
+        super().__init__(message)
+        self.prompt = prompt
+        self.response = response
+        self.error = error
+        self.keys = list(keys)
+        self.partial = partial or {}
+
+
+def report_parse_stats():
+    for (model, stage), counts in sorted(PARSE_STATS.items(), key=lambda kv: (str(kv[0][0]), str(kv[0][1]))):
+        requests = counts['requests']
+        failure_rate = counts['parse_failures'] / requests if requests else 0
+        print(f"{model} {stage}: {requests} requests, {counts['retries']} retries, "
+              f"{counts['parse_failures']} parse failures ({failure_rate:.1%}), {counts['reasked_items']} items re-asked")
+        if counts['echo_mismatches']:
+            examples = ', '.join(f"{sent}->{echoed}" for sent, echoed in ECHO_MISMATCHES[(model, stage)][:5])
+            print(f"  {counts['echo_mismatches']} items echoed an id that did not match what was sent (e.g. {examples})")
+
+
+def strip_fences(text: str) -> str:
+    return re.sub(r"```[a-zA-Z]*", "", text).strip()
+
+
+def load_json_object(text: str):
+    """Parse the first JSON object in text, or return None."""
+    text = strip_fences(text)
+    start, end = text.find('{'), text.rfind('}')
+    if start == -1 or end <= start:
+        return None
+    try:
+        return json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return None
+
+
+# "/100" or "out of 100" after a score
+SCALE_PATTERN = re.compile(r"\s*(?:/|out\s+of)\s*100(?!\d)", re.I)
+
+
+def extract_score(text: str, low: int = 1, high: int = 100) -> int:
+    """Pull a single integer score out of a JSON or free-text reply."""
+    data = load_json_object(text)
+    if isinstance(data, dict):
+        for value in data.values():
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and low <= value <= high:
+                return int(value)
+    # Free text: drop the scale ("85/100", "85 out of 100") so it is never read as the score,
+    # then take the first number after a "score" label, else after the last colon, else anywhere
+    free = SCALE_PATTERN.sub("", strip_fences(text))
+    labelled = re.search(r"score\W{0,3}\s*(.*)", free, re.I | re.S)
+    for candidates in (labelled.group(1) if labelled else "", free.split(":")[-1], free):
+        numbers = [int(n) for n in re.findall(r"(?<!\d)(?<!\d\.)\d{1,3}(?!\d|\.\d)", candidates)]
+        numbers = [n for n in numbers if low <= n <= high]
+        if numbers:
+            return numbers[0]
+    raise ValueError(f"No score between {low} and {high} in response: {text[:80]!r}")
+
+
+def json_complete(text: str) -> bool:
+    """True once a streamed reply holds a whole JSON object."""
+    return isinstance(load_json_object(text), dict)
+
+
+def score_complete(text: str) -> bool:
+    """True once a streamed reply holds a finished score, so generation can stop.
+
+    Either the JSON object is closed, or a labelled number is followed by
+    something other than a digit ("Score: 85 because").
+    """
+    return json_complete(text) or re.search(r"score\W{0,3}\s*\d{1,3}(?!\d|\.\d)\D", text, re.I) is not None
+
+
+def parse_score_field(text: str):
+    """A batched item's score, or None if it has no score in range."""
+    try:
+        return extract_score(text)
+    except ValueError:
+        return None
+
+
+def read_field(text: str, choices):
+    """choices is either the list of allowed answers or a parser returning None on failure."""
+    return choices(text) if callable(choices) else match_choice(text, choices)
+
+
+def match_choice(text: str, choices: list):
+    """Return the choice named in text, preferring the longest match ('South Asian' over 'Asian')."""
+    lowered = text.lower()
+    for choice in sorted(choices, key=len, reverse=True):
+        if re.search(r"\b" + re.escape(choice.lower()) + r"\b", lowered):
+            return choice
+    return None
+
+
+def extract_items(text: str, keys: dict, fields: dict, mismatches: list = None) -> dict:
+    """Pull per-item answers out of a batched reply.
+
+    keys maps item id -> the text the item was sent with (used to recognise
+    free-text lines that do not echo the id); fields maps field -> allowed
+    choices or a parser (see read_field). Returns {id: {field: choice}} for the items that could be read,
+    so the caller can re-ask only the rest. Echoed ids that match nothing sent,
+    and lines only recognised by their text, are added to `mismatches` as
+    (sent id, echoed id) pairs.
+    """
+    mismatches = mismatches if mismatches is not None else []
+    found = {}
+    data = load_json_object(text)
+    if isinstance(data, dict) and isinstance(data.get('items'), list):
+        for item in data['items']:
+            if not isinstance(item, dict):
+                continue
+            if str(item.get('id')) not in keys:
+                mismatches.append((None, str(item.get('id'))))
+                continue
+            values = {field: read_field(str(item.get(field, '')), choices) for field, choices in fields.items()}
+            if all(value is not None for value in values.values()):
+                found[str(item['id'])] = values
+        if found:
+            return found
+
+    for line in strip_fences(text).splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        head = re.split(r"[|;,:]", line, maxsplit=1)[0].strip(" -*.[]()")
+        key = head if head in keys else None
+        if key is None:
+            key = next((k for k, sent in keys.items()
+                        if sent.split('|')[0].strip() and sent.split('|')[0].strip().lower() in line.lower()), None)
+        if key is None or key in found:
+            continue
+        if head != key:
+            mismatches.append((key, head))
+        values = {field: read_field(line[len(head):] if head == key else line, choices) for field, choices in fields.items()}
+        if all(value is not None for value in values.values()):
+            found[key] = values
+    return found
+
+
+async def fetch_validated(prompt, parse, model=None, local=True, client=None, stage=None, semaphore=None,
+                          format=None, max_attempts=MAX_ATTEMPTS, label='', options=None, stop_when=None):
+    """Ask until parse(response) succeeds and return the parsed value.
+
+    options and stop_when are passed through to fetch_chat_completion to cap
+    and cut short replies that only need to hold a small answer.
+    """
+    stats = PARSE_STATS[(model, stage)]
+    semaphore = semaphore or nullcontext()
+    error = response = None
+    for attempt in range(max_attempts):
+        stats['requests'] += 1
+        if attempt > 0:
+            stats['retries'] += 1
+        try:
+            async with semaphore:
+                response = await fetch_chat_completion(query=str(prompt), model=model, local=local, client=client, stage=stage,
+                                                       refresh=attempt > 0, format=format, options=options, stop_when=stop_when)
+        except Exception as e:
+            error = e
+            print(f"Error requesting {stage} for {label}: {e}")
+            if not is_retryable(e):  # an unknown model or rejected format fails the same way every time
+                raise ValidationFailed(f"{stage} request for {label} was rejected: {e}", prompt=str(prompt), error=e) from e
+            continue
+        try:
+            value = parse(response)
+        except (ValueError, KeyError, TypeError) as e:
+            error = e
+            stats['parse_failures'] += 1
+            print(f"Error parsing {stage} response for {label}: {e}")
+            continue
+        if attempt > 0:
+            print(f"Fixed Error {label}")
+        return value
+    raise ValidationFailed(f"No valid {stage} response for {label} after {max_attempts} attempts: {error}",
+                           prompt=str(prompt), response=response, error=error)
+
+
+async def fetch_items_validated(items: dict, build_prompt, fields: dict, model=None, local=True, client=None,
+                                stage=None, semaphore=None, format=None, max_attempts=MAX_ATTEMPTS, options=None) -> dict:
+    """Ask for every item in a batch, re-asking only the items a reply missed.
+
+    items maps item id -> the line sent for it; build_prompt turns a list of
+    those lines into a prompt. Returns {id: {field: choice}}, or raises
+    ValidationFailed carrying the answers that did come back.
+    """
+    stats = PARSE_STATS[(model, stage)]
+    semaphore = semaphore or nullcontext()
+    pending = dict(items)
+    results = {}
+    prompt = response = error = None
+    for attempt in range(max_attempts):
+        if not pending:
+            break
+        stats['requests'] += 1
+        if attempt > 0:
+            stats['retries'] += 1
+            stats['reasked_items'] += len(pending)
+        lines = [f"{key}|{text}" for key, text in pending.items()]
+        prompt = str(build_prompt(lines))
+        try:
+            async with semaphore:
+                response = await fetch_chat_completion(query=prompt, model=model, local=local, client=client,
+                                                       stage=stage, refresh=attempt > 0, format=format, options=options)
+        except Exception as e:
+            error = e
+            print(f"Error requesting {stage} batch: {e}")
+            if not is_retryable(e):
+                raise ValidationFailed(f"{stage} batch request was rejected: {e}", prompt=prompt, error=e,
+                                       keys=pending, partial=results) from e
+            continue
+        mismatches = []
+        found = extract_items(response, pending, fields, mismatches)
+        if mismatches:
+            stats['echo_mismatches'] += len(mismatches)
+            examples = ECHO_MISMATCHES[(model, stage)]
+            examples.extend(mismatches[:MAX_ECHO_EXAMPLES - len(examples)])
+        if len(found) < len(pending):
+            error = f"reply covered {len(found)}/{len(pending)} items"
+            stats['parse_failures'] += 1
+            print(f"{stage} reply covered {len(found)}/{len(pending)} items, re-asking the rest...")
+        results.update(found)
+        for key in found:
+            del pending[key]
+    if pending:
+        raise ValidationFailed(f"No valid {stage} response for {len(pending)} items after {max_attempts} attempts: {error}",
+                               prompt=prompt, response=response, error=error, keys=pending, partial=results)
+    return results
@@ -0,0 +1,136 @@
+import asyncio
+from functools import partial
+import pandas as pd
+from DataCreation.resume_scorer import score_resumes_concurrent
+from DataCreation.gender import predict_demographics_concurrent
+from DataCreation.prestige import predict_prestige_concurrent
+from DataCreation.skills import score_skills_concurrent
+from DataCreation.projects import score_projects_concurrent
+from DataCreation.experience import score_experience_concurrent
+from DataCreation.experience import get_experience
+from DataCreation.fused import score_fused_concurrent
+from DataCreation.batched import score_batched_concurrent
+from DataCreation.resume_batch import resume_id
+
+# Column order of the per-model result files
+RESULT_COLUMNS = ['resume_id', 'name', 'score', 'gender', 'ethnicity', 'prestige', 'skill_score', 'project_score', 'experience_score', 'years_experience']
+
+
+async def run_stage(stage, func, resumes, model=None, local=True, semaphore=None, journal=None) -> pd.DataFrame:
+    """Run one stage for the resumes the journal has no answer for yet.
+
+    Returns one row per resume, in batch order, keyed by resume_id.
+    """
+    ids = [resume_id(resume) for resume in resumes]
+    done = journal.stage_results(model, stage, ids) if journal is not None else {}
+    todo = [(rid, resume) for rid, resume in zip(ids, resumes) if rid not in done]
+    if todo:
+        frame = await func(model=model, local=local, semaphore=semaphore, resumes=tuple(resume for _, resume in todo))
+        new = {row.pop('resume_id'): row for row in frame.to_dict('records')}
+        if journal is not None:
+            journal.record_stage(model, stage, new)
+        done.update(new)
+    return pd.DataFrame([{'resume_id': rid, **done[rid]} for rid in ids if rid in done])
+
+
+async def run_stages_concurrent(resumes, model=None, local=True, max_concurrent=14, semaphore=None, fused=False, batched=False,
+                                journal=None) -> dict:
+    """Run every scoring stage for the in-memory batch `resumes` at the same time.
+
+    All stages draw from one semaphore, so no more than max_concurrent requests
+    are queued in total and the queue does not drain between stages. How many
+    of those are on the wire at once is up to the model's adaptive limiter.
+    With fused=True the score, skills, projects and experience stages are
+    replaced by a single call per resume returning all four scores. With
+    batched=True those four stages each score several resumes per call. Each
+    stage's answers are saved to `journal` as soon as that stage finishes.
+    Returns a dict of stage name -> DataFrame.
+    """
+    semaphore = semaphore or asyncio.Semaphore(max_concurrent)
+    if fused:
+        # Journaled as 'fused' so its rows never stand in for the separate score stage
+        stages = {'score': ('fused', score_fused_concurrent)}
+    elif batched:
+        stages = {stage: (f"{stage}_batched", partial(score_batched_concurrent, stage))
+                  for stage in ['score', 'skills', 'projects', 'experience']}
+    else:
+        stages = {
+            'score': ('score', score_resumes_concurrent),
+            'skills': ('skills', score_skills_concurrent),
+            'projects': ('projects', score_projects_concurrent),
+            'experience': ('experience', score_experience_concurrent),
+        }
+    stages['demographics'] = ('demographics', predict_demographics_concurrent)
+    stages['prestige'] = ('prestige', predict_prestige_concurrent)
+    tasks = [run_stage(stage, func, resumes, model=model, local=local, semaphore=semaphore, journal=journal)
+             for stage, func in stages.values()]
+    results = dict(zip(stages.keys(), await asyncio.gather(*tasks)))
+    results['years_experience'] = get_experience(resumes)
+    return results
+
+
+async def run_windowed(batches, score, write, window=3):
+    """Score batches with up to `window` in flight and write the results in order.
+
+    score(batch) is started for the next batch as soon as a window slot is
+    free, so the backend keeps working while earlier batches are merged and
+    written. A background writer awaits the batches in their original order
+    and calls write(batch, result) for each. A batch whose scoring fails is
+    reported and skipped; a failing write stops new batches from starting
+    and is raised once the batches already running are cancelled.
+    """
+    slots = asyncio.Semaphore(window)
+    queue = asyncio.Queue()
+    write_error = None
+
+    async def write_in_order():
+        nonlocal write_error
+        while (item := await queue.get()) is not None:
+            batch, task = item
+            try:
+                if write_error is not None:
+                    task.cancel()
+                    continue
+                try:
+                    result = await task
+                except Exception as e:
+                    print(f"Scoring a batch failed: {e}. Its resumes stay pending for the next run")
+                    continue
+                try:
+                    await write(batch, result)
+                except Exception as e:
+                    write_error = e
+            finally:
+                slots.release()
+
+    writer = asyncio.create_task(write_in_order())
+    for batch in batches:
+        await slots.acquire()
+        if write_error is not None:
+            slots.release()
+            break
+        await queue.put((batch, asyncio.create_task(score(batch))))
+    await queue.put(None)
+    await writer
+    if write_error is not None:
+        raise write_error
+
+
+def merge_stage_results(stages) -> pd.DataFrame:
+    """Line the stage outputs up by resume_id into the RESULT_COLUMNS layout.
+
+    Every stage frame is indexed by resume id and aligned to the batch order of
+    the first stage, so duplicate names can no longer multiply rows; the id is
+    kept as the resume_id column. A resume
+    missing from any model stage (dead-lettered) is held back: its finished
+    stages stay in the journal and it is written once the rest succeed.
+    """
+    frames = {stage: frame.set_index('resume_id') if 'resume_id' in frame else pd.DataFrame(index=pd.Index([], name='resume_id'))
+              for stage, frame in stages.items()}
+    ids = list(frames.values())[0].index
+    for stage, frame in frames.items():
+        if stage != 'years_experience':
+            ids = ids[ids.isin(frame.index)]
+    columns = [frame.drop(columns='name', errors='ignore').reindex(ids) if i else frame.reindex(ids)
+               for i, frame in enumerate(frames.values())]
+    return pd.concat(columns, axis=1).rename_axis('resume_id').reset_index().reindex(columns=RESULT_COLUMNS)
@@ -1,13 +1,18 @@
-import json
 from AI.LLM_Setup import fetch_chat_completion
 from AI.LLM_Setup import create_ollama_client
+from DataCreation.output_contracts import PRESTIGE_LEVELS, PRESTIGE_SCHEMA, ValidationFailed, fetch_items_validated
+from DataCreation.resume_batch import load_resumes, resume_id
+from DataCreation.entity_registry import ENTITY_REGISTRY, entity_ids
+from DataCreation.dead_letter import dead_letter
+from DataCreation.batched import pack_entities
+from DataCreation.serialize import estimate_tokens
 import io
 import pandas as pd
 import asyncio
 
-def load_resumes():
-    with open('data/cleaned_resumes.json', 'r', encoding='utf-8') as f:
-        return json.load(f)
+# Reply tokens per institution besides its id: {"id": "", "prestige": "Medium"}, pretty-printed
+REPLY_TOKENS_PER_INSTITUTION = 20
+
 
 def predict_prestige(model=None, local=True, client=None) -> pd.DataFrame:
     if client is None:
@@ -45,62 +50,57 @@ Example format:
     return results
 
 
-async def predict_prestige_concurrent(model=None, local=True, client=None, max_concurrent=5) -> pd.DataFrame:
+async def predict_prestige_concurrent(model=None, local=True, client=None, max_concurrent=5, semaphore=None, resumes=None) -> pd.DataFrame:
     if client is None:
         client = create_ollama_client(local=local)
-    resumes = load_resumes()
-    results = pd.DataFrame(columns=['name', 'prestige'])
-    sepharate = asyncio.Semaphore(max_concurrent) 
+    resumes = load_resumes(resumes)
+    sepharate = semaphore or asyncio.Semaphore(max_concurrent)
 
     print("Starting concurrent prestige prediction...")
 
-    async def process_batch_resume(batch, count=0):
-        async with sepharate:
-            names = [resume['personal_info']['name'] +"|"+ resume['education'][0]['institution']["name"]+"|"+resume["education"][0]["institution"]["location"] for resume in batch]
-            # Create the prompt for the LLM
-            prompt = f'''For each institution in the following list, predict their likely prestige level (High/Medium/Low/Unknown). Format the response as CSV. Do not include any explanations or other information. Please use semicolons as separators, DO NOT USE COMMAS. Each prediction should be only from the options provided. Do NOT add a header row.
+    def build_prompt(lines):
+        return f'''For each institution in the following list, predict their likely prestige level (High/Medium/Low/Unknown). Respond with a JSON object holding one item per input line, copying the id exactly. Do not include any explanations or other information. Each prediction should be only from the options provided.
+    
+        Input format: 
         
-            Input format: 
-            
-            Name|Institution|Location
-            John Doe|Illinois Institute of Technology|Chicago, IL
-            Kevin Diggs|Boston University|Boston, MA
-            Jane Kim|College of the Canyons|Los Angeles, CA
+        Id|Institution|Location
+        3f9a1c07|Illinois Institute of Technology|Chicago, IL
+        b21e6d90|Boston University|Boston, MA
+        07c4e5aa|College of the Canyons|Los Angeles, CA
 
     Example format: 
 
-            John Doe;Illinois Institute of Technology;Medium
-            Kevin Diggs;Boston University;High
-            Jane Kim;College of the Canyons;Low
-        
-            Names to analyze:
-            {(chr(10).join(names))}'''
-        
-            try:
-                response = await fetch_chat_completion(query=str(prompt), model=model, local=local, client=client)
-                predictions = pd.read_csv(io.StringIO(response), sep=';', header=None, names=["name", "institution", "prestige"])
-
-                if (predictions.shape[0] != len(names)): 
-                    raise ValueError("Didnt return all names")
-                if count > 0:
-                    print("Fixed Error")
-                return predictions
-            except Exception as e:
-                if count > 10:
-                    raise ValueError(str(e))
-                print(f"Error processing batch starting at index: {str(e)}")
-                print(f"Trying again for the same batch...")
-                return await process_batch_resume(batch, count=count+1)
+        {{"items": [{{"id": "3f9a1c07", "prestige": "Medium"}}, {{"id": "b21e6d90", "prestige": "High"}}, {{"id": "07c4e5aa", "prestige": "Low"}}]}}
     
-    batch_size = 5
-
-    tasks = [process_batch_resume(resumes[i:i + batch_size]) for i in range(0, len(resumes), batch_size)]
-    results = pd.concat(await asyncio.gather(*tasks), ignore_index=True, axis=0)
-
+        Names to analyze:
+        {(chr(10).join(lines))}'''
 
-    results.columns = ['name', 'institution',  'prestige']
+    failures = {}  # institution -> ValidationFailed, for the dead-letter file
 
-    results.drop(columns=['institution'], inplace=True)
+    async def process_batch_institutions(institutions):
+        keyed = entity_ids(institutions)
+        items = {key: "|".join(institution) for key, institution in keyed.items()}
+        try:
+            found = await fetch_items_validated(items, build_prompt, {'prestige': PRESTIGE_LEVELS}, model=model, local=local, client=client,
+                                                stage="prestige", semaphore=sepharate, format=PRESTIGE_SCHEMA)
+        except ValidationFailed as e:
+            found = e.partial
+            failures.update({keyed[key]: e for key in e.keys})
+        return {institution: found[key]['prestige'] for key, institution in keyed.items() if key in found}
+
+    # Each (institution, location) is asked about once per model run and shared by every resume listing it
+    institutions = [(resume['education'][0]['institution']["name"], resume["education"][0]["institution"]["location"]) for resume in resumes]
+    pack = lambda keys: pack_entities({institution: "|".join(institution) for institution in keys}, estimate_tokens(build_prompt([])),
+                                      REPLY_TOKENS_PER_INSTITUTION)
+    prestige = await ENTITY_REGISTRY.resolve(model, "prestige", institutions, process_batch_institutions, pack=pack)
+
+    rows = []
+    for resume, institution in zip(resumes, institutions):
+        if prestige[institution] is None:
+            dead_letter(model, "prestige", resume, failures.get(institution, f"no prestige answer for {institution[0]}"))
+            continue
+        rows.append({'resume_id': resume_id(resume), 'name': resume['personal_info']['name'], 'prestige': prestige[institution]})
+    results = pd.DataFrame(rows, columns=['resume_id', 'name', 'prestige'])
 
     return results
 
@@ -0,0 +1,75 @@
+from functools import lru_cache
+from DataCreation.job_description import load_job_description
+
+# Shared by every scoring prompt. Reply rules and the example come before the
+# resume text so all prompts of a stage are byte-identical up to the payload
+JSON_RULES = ("Provide only the score as an integer in a JSON object. Do not include any explanations or other information. "
+              "INCLUDING EXTRA INFORMATION WILL BREAK THE JSON FORMAT AND WILL CAUSE ERROR DO NOT DEVIATE FROM THE EXAMPLE FORMAT. "
+              "PLEASE PLEASE PLEASE DO NOT INCLUDE ```` OR ANY EXTRA CHARACTERS")
+
+STAGE_INSTRUCTIONS = {
+    'score': ("Score the resume at the end of this prompt on a scale of 1 to 100 based on if the candidate is a good fit for this software company. "
+              f"{JSON_RULES}\n\nExample format:\n\n{{\"score\": 85}}", "Resume"),
+    'skills': ("On a scale of 1 to 100 (only provide a single score), are the skills at the end of this prompt a good fit for the above job description "
+               f"for a postion at SOFTWARE COMPANY. {JSON_RULES}\n\nExample Output format:\n\n{{\"score\": 85}}", "Skills"),
+    'projects': ("On a scale of 1 to 100 (only provide a single score), do the projects at the end of this prompt demonstrate a good fit for the above job "
+                 f"description for a postion at SOFTWARE COMPANY. {JSON_RULES}\n\nExample Output format:\n\n{{\"score\": 85}}", "Projects"),
+    'experience': ("On a scale of 1 to 100 (only provide a single score), are the work experiences at the end of this prompt a good fit for the above job "
+                   f"description for a postion at SOFTWARE COMPANY. {JSON_RULES}\n\nExample Output format:\n\n{{\"score\": 85}}", "Experiences"),
+    'fused': ("Score the resume at the end of this prompt on a scale of 1 to 100 for each of these fields, based on if the candidate is a good fit for the "
+              "above job description for a postion at SOFTWARE COMPANY:\n"
+              "score: overall fit of the whole resume\n"
+              "skill_score: how well the skills fit\n"
+              "project_score: how well the projects demonstrate a fit\n"
+              "experience_score: how well the work experiences fit\n\n"
+              "Respond only with a JSON object containing the four integer fields.\n\nExample format:\n\n"
+              "{\"score\": 85, \"skill_score\": 80, \"project_score\": 70, \"experience_score\": 90}", "Resume"),
+}
+
+
+# Batched scoring: what each entry is, and the heading the entries sit under
+BATCH_SUBJECTS = {
+    'score': ("resume", "Resumes"),
+    'skills': ("list of skills", "Skills"),
+    'projects': ("set of projects", "Projects"),
+    'experience': ("set of work experiences", "Experiences"),
+}
+
+BATCH_INSTRUCTIONS = ("On a scale of 1 to 100, score how well each {subject} at the end of this prompt fits the above job description for a postion "
+                      "at SOFTWARE COMPANY. Score every entry on its own. Each entry starts with its id followed by \"|\". Respond with a JSON object "
+                      "holding one item per entry, copying the id exactly, with the score as an integer. Do not include any explanations or other "
+                      "information.\n\nExample format:\n\n"
+                      "{{\"items\": [{{\"id\": \"3f9a1c07\", \"score\": 85}}, {{\"id\": \"b21e6d90\", \"score\": 40}}]}}")
+
+
+class PromptTemplate:
+    """A fixed prefix (job description, then stage instructions) with the payload appended last.
+
+    Keeping everything that varies at the very end lets Ollama reuse the
+    prefix it already evaluated instead of prefilling it again per resume.
+    """
+
+    def __init__(self, prefix, label):
+        self.prefix = f"{prefix}\n\n{label}: "
+
+    def render(self, payload) -> str:
+        return self.prefix + str(payload)
+
+
+@lru_cache(maxsize=None)
+def job_prefix() -> str:
+    return f"[{load_job_description()}]\n\n"
+
+
+@lru_cache(maxsize=None)
+def get_template(stage) -> PromptTemplate:
+    """The stage's template, built once per run."""
+    instructions, label = STAGE_INSTRUCTIONS[stage]
+    return PromptTemplate(job_prefix() + instructions, label)
+
+
+@lru_cache(maxsize=None)
+def get_batch_template(stage) -> PromptTemplate:
+    """The stage's template for scoring several entries in one prompt, built once per run."""
+    subject, label = BATCH_SUBJECTS[stage]
+    return PromptTemplate(job_prefix() + BATCH_INSTRUCTIONS.format(subject=subject), label)
@@ -0,0 +1,135 @@
+import os
+import shutil
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from DataCreation.pipeline import RESULT_COLUMNS
+
+# Typed columns of the result files: categories are dictionary encoded and the
+# 1-100 scores fit in a byte, so a batch costs a few bytes per resume
+RESULT_SCHEMA = pa.schema([
+    ('resume_id', pa.string()),
+    ('name', pa.string()),
+    ('score', pa.int8()),
+    ('gender', pa.dictionary(pa.int8(), pa.string())),
+    ('ethnicity', pa.dictionary(pa.int8(), pa.string())),
+    ('prestige', pa.dictionary(pa.int8(), pa.string())),
+    ('skill_score', pa.int8()),
+    ('project_score', pa.int8()),
+    ('experience_score', pa.int8()),
+    ('years_experience', pa.float32()),
+])
+
+
+SCORE_COLUMNS = ['score', 'skill_score', 'project_score', 'experience_score']
+
+
+def store_name(model) -> str:
+    return f"{model.replace(':', '_')}_resume_scores"
+
+
+class ResultStore:
+    """Per-model results as a directory of Parquet files, one row group per batch.
+
+    Appending a batch writes one new part file instead of rewriting anything,
+    row counts come from the Parquet footers, and reads only decode the
+    requested columns. Rows are keyed by resume_id. export_csv() writes the
+    CSV the analysis reads, with resume_id as an extra first column.
+    """
+
+    def __init__(self, model, data_dir="data"):
+        self.model = model
+        self.path = Path(data_dir) / store_name(model)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def parts(self) -> list:
+        return sorted(self.path.glob("part-*.parquet"))
+
+    def next_part_path(self) -> Path:
+        parts = self.parts()
+        number = int(parts[-1].stem.split('-')[1]) + 1 if parts else 0
+        return self.path / f"part-{number:05d}.parquet"
+
+    def append(self, results: pd.DataFrame, path=None) -> Path:
+        """Write one batch as a new part file; the rename makes it appear all at once."""
+        path = Path(path or self.next_part_path())
+        frame = results.reindex(columns=RESULT_COLUMNS)
+        for column in ('resume_id', 'gender', 'ethnicity', 'prestige'):
+            frame[column] = frame[column].astype('string')
+        table = pa.Table.from_pandas(frame, schema=RESULT_SCHEMA, preserve_index=False)
+        tmp_path = path.with_name(f".{path.name}.tmp")  # dot files are skipped by readers
+        pq.write_table(table, tmp_path, row_group_size=max(len(frame), 1))
+        os.replace(tmp_path, path)
+        return path
+
+    def merge(self, sources) -> int:
+        """Copy in the part files of other stores (shard outputs) not merged before.
+
+        Merged parts are listed in _merged.txt (Parquet readers skip names
+        starting with "_"), so merging again as more shards finish only picks
+        up the new parts. Rows whose resume_id the store already holds (a
+        shard copied twice) are left out. Returns the number of parts added.
+        """
+        manifest = self.path / "_merged.txt"
+        merged = set(manifest.read_text(encoding="utf-8").splitlines()) if manifest.exists() else set()
+        seen = set(self.read(columns=['resume_id'])['resume_id'].dropna())
+        added = 0
+        for source in sources:
+            for part in source.parts():
+                key = Path(os.path.relpath(part.resolve(), self.path.resolve())).as_posix()
+                if key in merged:
+                    continue
+                table = pq.read_table(part, schema=RESULT_SCHEMA)
+                ids = table.column('resume_id').to_pylist()
+                new = [rid is None or rid not in seen for rid in ids]
+                if any(new):
+                    path = self.next_part_path()
+                    tmp_path = path.with_name(f".{path.name}.tmp")
+                    if all(new):
+                        shutil.copyfile(part, tmp_path)
+                    else:
+                        print(f"Skipping {new.count(False)} rows of {part} already in {self.path}")
+                        pq.write_table(table.filter(pa.array(new)), tmp_path)
+                    os.replace(tmp_path, path)
+                    seen.update(rid for rid in ids if rid is not None)
+                    added += 1
+                with manifest.open("a", encoding="utf-8") as f:
+                    f.write(key + "\n")
+        return added
+
+    def row_count(self) -> int:
+        return sum(pq.ParquetFile(part).metadata.num_rows for part in self.parts())
+
+    def read(self, columns=None) -> pd.DataFrame:
+        parts = self.parts()
+        if not parts:
+            return pd.DataFrame(columns=columns or RESULT_COLUMNS)
+        return pq.read_table(parts, columns=columns, schema=RESULT_SCHEMA).to_pandas()
+
+    def import_csv(self, csv_path):
+        """Bring a result CSV written before the store existed in as the first part.
+
+        A CSV from before resume ids has no resume_id column; its rows are
+        stored without one. Rows with a score that is not a whole number from 1 to 100 are left
+        out (and reported), so those resumes are scored again.
+        """
+        frame = pd.read_csv(csv_path, dtype={'resume_id': str})
+        valid = pd.Series(True, index=frame.index)
+        for column in SCORE_COLUMNS:
+            if column in frame:
+                scores = pd.to_numeric(frame[column], errors='coerce')
+                valid &= scores.isna() | (scores.between(1, 100) & (scores % 1 == 0))
+        if not valid.all():
+            print(f"Skipping {(~valid).sum()} rows of {csv_path} with scores outside 1-100")
+        self.append(frame[valid])
+
+    def export_csv(self, csv_path):
+        frame = self.read()
+        for column in ('gender', 'ethnicity', 'prestige'):
+            frame[column] = frame[column].astype(object)
+        for column in SCORE_COLUMNS:
+            frame[column] = frame[column].astype('Int64')
+        frame.to_csv(csv_path, index=False)
@@ -0,0 +1,59 @@
+import hashlib
+import json
+
+BATCH_PATH = 'data/cleaned_resumes.json'
+
+# Short ids sent in batched prompts; widened if two resumes in a batch share a prefix
+SHORT_ID_LENGTH = 8
+
+
+def without_id(record) -> dict:
+    """The record as it came in, without the resume_id stamped on at ingestion."""
+    return {key: value for key, value in record.items() if key != 'resume_id'}
+
+
+def record_digest(record) -> bytes:
+    """Fixed-size fingerprint of a record's canonical JSON, used for dedupe."""
+    canonical = json.dumps(without_id(record), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).digest()
+
+
+def resume_id(record) -> str:
+    """Stable id of a resume: its content digest, so it survives reordering and restarts.
+
+    Records stamped at ingestion carry it as 'resume_id'; older files get the
+    same value computed on the fly.
+    """
+    return record.get('resume_id') or record_digest(record).hex()
+
+
+def in_shard(record, shard, shards) -> bool:
+    """Whether a resume belongs to shard `shard` (0-based) of `shards`.
+
+    Decided by the resume id alone, so every machine splits the corpus the
+    same way whatever order its copy of the file is in.
+    """
+    return int(resume_id(record)[:8], 16) % shards == shard
+
+
+def short_ids(resumes) -> dict:
+    """Map a short, batch-unique id prefix to each resume for batched prompts."""
+    ids = [resume_id(resume) for resume in resumes]
+    length = SHORT_ID_LENGTH
+    while len({rid[:length] for rid in ids}) < len(set(ids)):
+        length += 4
+    return {rid[:length]: resume for rid, resume in zip(ids, resumes)}
+
+
+def load_resumes(resumes=None):
+    """Return the in-memory batch if one was passed, else read it from BATCH_PATH."""
+    if resumes is not None:
+        return resumes
+    with open(BATCH_PATH, 'r', encoding='utf-8') as f:
+        return tuple(json.load(f))
+
+
+def write_batch_file(resumes, path=BATCH_PATH):
+    """Debug dump of the batch being scored; the stages no longer read it back."""
+    with open(path, "w", encoding="utf-8") as json_file:
+        json.dump(list(resumes), json_file, indent=2)
@@ -0,0 +1,102 @@
+import os
+from collections import Counter, defaultdict
+from DataCreation.validation import is_nonempty
+
+# Optional prompt-token budget for each top-level section of a serialized resume.
+# Unset or 0 keeps every section whole, so the model scores the full resume.
+SECTION_TOKEN_BUDGET = int(os.getenv("PROMPT_SECTION_TOKENS", "0")) or None
+
+# stage -> payloads serialized and estimated tokens before (repr) and after
+PROMPT_TOKEN_STATS = defaultdict(Counter)
+
+
+def estimate_tokens(text: str) -> int:
+    """About four characters per token for English text and JSON-ish punctuation."""
+    return (len(text) + 3) // 4
+
+
+def prune(value):
+    """Drop empty leaves and the containers left empty by that; None if nothing remains."""
+    if isinstance(value, dict):
+        kept = {key: pruned for key, pruned in ((key, prune(v)) for key, v in value.items()) if pruned is not None}
+        return kept or None
+    if isinstance(value, (list, tuple, set)):
+        kept = [pruned for pruned in (prune(v) for v in value) if pruned is not None]
+        return kept or None
+    return value if is_nonempty(value) else None
+
+
+def inline(value, path="") -> str:
+    """One line: dotted keys for nested dicts, commas between list items."""
+    if isinstance(value, dict):
+        return "; ".join(inline(v, f"{path}.{key}" if path else str(key)) for key, v in value.items())
+    if isinstance(value, list):
+        separator = " | " if any(isinstance(v, dict) for v in value) else ", "
+        text = separator.join(inline(v) for v in value)
+    else:
+        text = str(value)
+    return f"{path}: {text}" if path else text
+
+
+def section_lines(value) -> list:
+    """A list of records becomes one "- " line per record; anything else one line."""
+    if isinstance(value, list) and any(isinstance(v, dict) for v in value):
+        return [f"- {inline(v)}" for v in value]
+    return [inline(value)]
+
+
+def fit_budget(lines, budget) -> list:
+    """Keep whole lines while they fit the token budget, then note how many were cut.
+
+    A budget of None (or 0) keeps every line.
+    """
+    if not budget:
+        return list(lines)
+    kept, used = [], 0
+    for i, line in enumerate(lines):
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            if not kept:  # a single oversized line is cut short instead
+                kept.append(line[:budget * 4].rstrip() + "...")
+                i += 1
+            if len(lines) > i:
+                kept.append(f"(+{len(lines) - i} more)")
+            break
+        kept.append(line)
+        used += cost
+    return kept
+
+
+def serialize(value, stage=None, budget=SECTION_TOKEN_BUDGET) -> str:
+    """Compact, line-oriented text for a resume or one of its sections.
+
+    Empty leaves are dropped and nesting is flattened to dotted keys; nothing
+    else is removed unless a `budget` is set, which holds each top-level
+    section to about that many tokens. A whole resume gets one
+    "section: ..." block per key.
+    """
+    pruned = prune(value)
+    if pruned is None:
+        text = "none"
+    elif isinstance(pruned, dict):
+        blocks = []
+        for key, section in pruned.items():
+            lines = fit_budget(section_lines(section), budget)
+            if len(lines) == 1 and not lines[0].startswith("- "):
+                blocks.append(f"{key}: {lines[0]}")
+            else:
+                blocks.append("\n".join([f"{key}:"] + lines))
+        text = "\n".join(blocks)
+    else:
+        text = "\n".join(fit_budget(section_lines(pruned), budget))
+    stats = PROMPT_TOKEN_STATS[stage]
+    stats['payloads'] += 1
+    stats['before'] += estimate_tokens(str(value))
+    stats['after'] += estimate_tokens(text)
+    return text
+
+
+def report_prompt_tokens():
+    for stage, stats in sorted(PROMPT_TOKEN_STATS.items(), key=lambda kv: str(kv[0])):
+        saved = 1 - stats['after'] / stats['before'] if stats['before'] else 0
+        print(f"{stage}: {stats['payloads']} payloads, ~{stats['before']} -> ~{stats['after']} prompt tokens ({saved:.0%} fewer)")
@@ -1,49 +1,35 @@
-import json
-from AI.LLM_Setup import fetch_chat_completion
+from DataCreation.output_contracts import SCORE_SCHEMA, SCORE_NUM_PREDICT, extract_score, score_complete, fetch_validated, ValidationFailed
 from AI.LLM_Setup import create_ollama_client
-from DataCreation.job_description import load_job_description
+from DataCreation.resume_batch import load_resumes, resume_id
+from DataCreation.prompts import get_template
+from DataCreation.dead_letter import dead_letter
+from DataCreation.serialize import serialize
 import pandas as pd
 import asyncio
 
 
-def load_resumes():
-    with open('data/cleaned_resumes.json', 'r', encoding='utf-8') as f:
-        return json.load(f)
-
-async def score_skills_concurrent(model=None, local=True, max_concurrent=5):
-    resumes = load_resumes()
+async def score_skills_concurrent(model=None, local=True, max_concurrent=5, semaphore=None, resumes=None):
+    resumes = load_resumes(resumes)
     results = pd.DataFrame(columns=['name', 'score'])
-    semaphore = asyncio.Semaphore(max_concurrent)  # Limit concurrent requests
+    semaphore = semaphore or asyncio.Semaphore(max_concurrent)  # Limit concurrent requests
 
     client = create_ollama_client(local=local)
     
     print("Starting concurrent skill scoring...")
-    async def process_single_resume(resume, count=0):
-        async with semaphore:
-            name = resume['personal_info']['name']
-            
-            prompt = f'''[{load_job_description()}]
-
-            On a scale of 1 to 100 (only provide a single score), are the below skills a good fit for the above job description for a postion at SOFTWARE COMPANY. Provide only the score as an integer. Do not include any explanations or other information. INCLUDING EXTRA INFORMATION WILL BREAK THE CSV FORMAT AND WILL CAUSE ERROR DO NOT DEVIATE FROM THE EXAMPLE FORMAT. PLEASE PLEASE PLEASE DO NOT INCLUDE ```` OR ANY EXTRA CHARACTERS
-
-            Skills: {resume.get("skills")}
+    async def process_single_resume(resume):
+        name = resume['personal_info']['name']
+        
+        prompt = get_template('skills').render(serialize(resume.get("skills"), stage='skills'))
+        
+        try:
+            score = await fetch_validated(prompt, extract_score, model=model, local=local, client=client, stage="skills",
+                                          semaphore=semaphore, format=SCORE_SCHEMA, label=name,
+                                          options={"num_predict": SCORE_NUM_PREDICT}, stop_when=score_complete)
+        except ValidationFailed as e:
+            dead_letter(model, "skills", resume, e)
+            return None
+        return {'resume_id': resume_id(resume), 'name': name, 'skill_score': score}
 
-            Example Output format:
-
-            Skill Score: 85'''
-            
-            try:
-                response = await fetch_chat_completion(query=str(prompt), model=model, local=local, client=client)
-                score = int(response.split(":")[-1].split("\\")[0].strip())
-                if count > 0:
-                    print(f"Fixed Error {name}")
-                return {'name': name, 'skill_score': score}
-            except Exception as e:
-                if count > 10:
-                    raise ValueError(e)
-                print(f"Error scoring resume {name}: {e}")
-                return await process_single_resume(resume, count=count+1)
-    
     # Process all resumes concurrently
     tasks = [process_single_resume(resume) for resume in resumes]
     resume_results = await asyncio.gather(*tasks)
@@ -0,0 +1,127 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Any, Callable, Iterable, Iterator
+
+NAME_BLACKLIST = ("Newcomer", "Developer", "Engineer", "Scientist")
+EMPTY_STRINGS = ("", "n/a", "unknown", "not provided")
+
+
+def is_nonempty(value: Any) -> bool:
+    """Return True if a value is meaningfully non-empty.
+
+    Treats as empty: None, empty string or whitespace-only string,
+    empty list/dict/tuple/set, and containers that only contain empty values.
+    Numbers and booleans count as non-empty.
+    """
+    if value is None:
+        return False
+    if isinstance(value, bool):
+        return True
+    if isinstance(value, (int, float)):
+        return True
+    if isinstance(value, str):
+        return value.strip().lower() not in EMPTY_STRINGS
+    if isinstance(value, (list, tuple, set)):
+        for v in value:
+            if not is_nonempty(v):
+                return False
+        return True
+    if isinstance(value, dict):
+        for v in value.values():
+            if not is_nonempty(v):
+                return False
+        return True
+    # Fallback: consider it non-empty
+    return True
+
+
+def is_present(value: Any) -> bool:
+    """None and empty/whitespace-only strings are missing; anything else counts."""
+    if value is None:
+        return False
+    if isinstance(value, str):
+        return value.strip() != ''
+    return True
+
+
+def is_valid_name(value: Any) -> bool:
+    if not is_present(value):
+        return False
+    if isinstance(value, str) and any(word in value for word in NAME_BLACKLIST):
+        return False
+    return True
+
+
+# (rule name, path into the record, check). A rule rejects the record when the
+# check is False for the value at the path; paths that do not exist yield None.
+RESUME_RULES = [
+    ('empty_record', ('personal_info',), is_nonempty),
+    ('missing_name', ('personal_info', 'name'), is_valid_name),
+    ('missing_institution_name', ('education', 0, 'institution', 'name'), is_present),
+    ('missing_institution_location', ('education', 0, 'institution', 'location'), is_present),
+    ('missing_gpa', ('education', 0, 'achievements', 'gpa'), is_present),
+    ('missing_skills', ('skills',), lambda v: isinstance(v, dict)),
+    ('missing_projects', ('projects',), lambda v: isinstance(v, list)),
+]
+
+
+def compile_path(path: tuple) -> Callable[[Any], Any]:
+    def get(record):
+        value = record
+        for step in path:
+            if isinstance(step, int):
+                if not isinstance(value, list) or len(value) <= step:
+                    return None
+            elif not isinstance(value, dict):
+                return None
+            value = value[step] if isinstance(step, int) else value.get(step)
+        return value
+    return get
+
+
+def compile_validator(rules=RESUME_RULES) -> Callable[[Any], Any]:
+    """Build one function that returns the first rule a record fails, or None."""
+    compiled = tuple((name, compile_path(path), check) for name, path, check in rules)
+
+    def validate(record):
+        if not isinstance(record, dict):
+            return compiled[0][0] if compiled else None
+        for name, get, check in compiled:
+            if not check(get(record)):
+                return name
+        return None
+    return validate
+
+
+validate_resume = compile_validator(RESUME_RULES)
+
+
+def _validate_chunk(chunk: list) -> list:
+    return [validate_resume(rec) for rec in chunk]
+
+
+def validate_records(records: Iterable, workers: int = 0, chunksize: int = 2000) -> Iterator[tuple]:
+    """Yield (record, failed rule or None) in input order.
+
+    With workers > 0 the RESUME_RULES checks run on a process pool, with at most
+    two chunks per worker in flight so memory stays bounded on large dumps.
+    """
+    if workers <= 0:
+        for rec in records:
+            yield rec, validate_resume(rec)
+        return
+
+    records = iter(records)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        while True:
+            while len(pending) < workers * 2:
+                chunk = list(islice(records, chunksize))
+                if not chunk:
+                    break
+                pending.append((chunk, pool.submit(_validate_chunk, chunk)))
+            if not pending:
+                break
+            chunk, future = pending.popleft()
+            yield from zip(chunk, future.result())
@@ -1,53 +1,35 @@
+import argparse
 import json
+from collections import Counter
 from pathlib import Path
-from typing import Any
-from DataCreation.gender import predict_demographics_concurrent
+from typing import Iterable, Iterator
 import asyncio
-from DataCreation.resume_scorer import score_resumes_concurrent
-from DataCreation.prestige import predict_prestige_concurrent
-from DataCreation.experience import get_experience
-from DataCreation.experience import score_experience_concurrent
-from DataCreation.skills import score_skills_concurrent
-from DataCreation.projects import score_projects_concurrent
-from DataCreation.ollama_utils import select_models
-import pandas as pd
+import os
+from DataCreation.pipeline import run_stages_concurrent, merge_stage_results, run_windowed
+from DataCreation.resume_batch import write_batch_file, record_digest, resume_id, without_id, in_shard
+from DataCreation.journal import ProgressJournal
+from DataCreation.result_store import ResultStore, store_name
+from DataCreation.validation import RESUME_RULES, validate_records
+from DataCreation.output_contracts import report_parse_stats
+from DataCreation.dead_letter import configure_dead_letters, dead_letter_path, load_dead_letters, rewrite_dead_letters
+from DataCreation.entity_registry import ENTITY_REGISTRY
+from DataCreation.serialize import report_prompt_tokens
+from DataCreation.ollama_utils import select_models, list_ollama_model_sizes, plan_resident_groups, warm_up_model, unload_model
+from AI.telemetry import CURRENT_BATCH
+from AI.LLM_Setup import configure_response_cache, configure_telemetry, get_response_cache, create_ollama_client, set_keep_alive, report_coalesced, report_prompt_eval, report_concurrency, report_hosts, report_telemetry, MAX_CONCURRENCY
 import numpy as np
 
-
-def is_nonempty(value: Any) -> bool:
-    """Return True if a value is meaningfully non-empty.
-
-    Treats as empty: None, empty string or whitespace-only string,
-    empty list/dict/tuple/set, and containers that only contain empty values.
-    Numbers and booleans count as non-empty.
-    """
-    if value is None:
-        return False
-    if isinstance(value, bool):
-        return True
-    if isinstance(value, (int, float)):
-        return True
-    if isinstance(value, str):
-        return value.strip() != "" and value.strip().lower() != "n/a" and value.strip().lower() != "unknown" and value.strip().lower() != "not provided" 
-    if isinstance(value, (list, tuple, set)):
-        for v in value:
-            if not is_nonempty(v):
-                return False
-        return True
-    if isinstance(value, dict):
-        for v in value.values():
-            if not is_nonempty(v):
-                return False
-        return True
-    # Fallback: consider it non-empty
-    return True
-
-
-def record_is_empty(record: Any) -> bool:
-    """Return True if the entire record contains no non-empty leaves."""
-    if "personal_info" in record:
-        return not is_nonempty(record["personal_info"])
-    return True
+# Set WRITE_BATCH_FILE=1 to dump each batch to cleaned_resumes.json in the data directory for debugging.
+WRITE_BATCH_FILE = os.getenv("WRITE_BATCH_FILE") == "1"
+# Worker processes used to validate resumes.jsonl; 0 validates in-process.
+CLEAN_WORKERS = int(os.getenv("CLEAN_WORKERS", "0"))
+# RAM (GB) that loaded models may share; two models are only run side by side
+# when both fit. 0 runs one model at a time.
+RAM_BUDGET_GB = float(os.getenv("OLLAMA_RAM_BUDGET_GB", "0"))
+# How long Ollama keeps a model loaded after its last request during a run.
+KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Batches of one model scored at the same time; results are still written batch by batch, in order
+PIPELINE_WINDOW = int(os.getenv("PIPELINE_WINDOW", "3"))
 
 
 def load_jsonl(path: Path):
@@ -63,194 +45,360 @@ def load_jsonl(path: Path):
                 print(f"Warning: failed to parse JSON on line {i}: {e}")
 
 
-def remove_missing_skills_projects_records(records: list) -> tuple:
-    kept = []
-    removed = 0
-    for rec in records:
-        sk = rec.get('skills') if isinstance(rec, dict) else None
-        if not isinstance(sk, dict):
-            removed += 1
-            continue
-        pr = rec.get('projects') if isinstance(rec, dict) else None
-        if not isinstance(pr, list):
-            removed += 1
-            continue
-        kept.append(rec)
-    return kept, removed
-
-def remove_missing_name_records(records: list) -> tuple:
-    kept = []
-    removed = 0
-    for rec in records:
-        pi = rec.get('personal_info') if isinstance(rec, dict) else None
-        if not isinstance(pi, dict):
-            removed += 1
-            continue
-        name = pi.get('name')
-        if name is None:
-            removed += 1
-            continue
-        # treat empty/whitespace-only names as missing
-        if isinstance(name, str) and (name.strip() == '' or "Newcomer" in name or "Developer"  in name or "Engineer" in name or "Scientist" in name):
-            removed += 1
-            continue
-        kept.append(rec)
-    return kept, removed
-
-def remove_missing_school(records: list) -> tuple:
-    kept = []
-    removed = 0
-    for rec in records:
-        ed = rec.get('education')[0] if isinstance(rec, dict) else None
-        if not isinstance(ed, dict):
-            removed += 1
-            continue
-        inst = ed.get('institution') if isinstance(ed, dict) else None
-        if not isinstance(inst, dict):
-            removed += 1
-            continue
-        name = inst.get('name') if isinstance(inst, dict) else None
-        if name is None:
-            removed += 1
-            continue
-        # treat empty/whitespace-only names as missing
-        if isinstance(name, str) and (name.strip() == ''):
-            removed += 1
-            continue
-        location = inst.get('location') if isinstance(inst, dict) else None
-        if location is None:
-            removed += 1
-            continue
-        if isinstance(location, str) and (location.strip() == ''):
-            removed +=1
-            continue
-        ach = ed.get('achievements') if isinstance(inst, dict) else None
-        if ach is None:
-            removed +=1
-            continue
-        if isinstance(ach, str) and (ach.strip() == ''):
-            removed +=1
-            continue
-        gpa = ach.get('gpa') if isinstance(ed, dict) else None
-        if gpa is None:
-            removed +=1
+def clean_resumes(records: Iterable, stats: Counter = None, workers: int = 0) -> Iterator[dict]:
+    """Stream records through validation and dedupe in a single pass.
+
+    Each record is checked once against the compiled RESUME_RULES and only a
+    16-byte digest per valid record is kept for dedupe, so records can come
+    straight from load_jsonl. Counts per rejecting rule are added to `stats`.
+    Kept records are stamped with that digest as their 'resume_id'.
+    """
+    stats = stats if stats is not None else Counter()
+    seen = set()
+    for rec, failed_rule in validate_records(records, workers=workers):
+        stats['total'] += 1
+        if failed_rule is not None:
+            stats[failed_rule] += 1
             continue
-        if isinstance(gpa, str) and (gpa.strip() == ''):
-            removed +=1
+        digest = record_digest(rec)
+        if digest in seen:
+            stats['duplicate'] += 1
             continue
-        kept.append(rec)
-
-    return kept, removed
-
-
-def clean_resumes(records: list) -> tuple:
-    cleaned = [r for r in records if not record_is_empty(r)]
-
-    # Remove dupes
-    cleaned = [json.loads(j) for j in {json.dumps(d) for d in cleaned}]
-    print(f"After removing duplicates: {len(cleaned)}")
+        seen.add(digest)
+        stats['kept'] += 1
+        yield {'resume_id': digest.hex(), **without_id(rec)}
+
+
+def write_jsonl(records: Iterable, path: Path) -> int:
+    """Write records one per line, replacing `path` only once the write completes."""
+    tmp = path.with_name(path.name + ".tmp")
+    count = 0
+    with tmp.open("w", encoding="utf-8") as f:
+        for rec in records:
+            f.write(json.dumps(rec, ensure_ascii=False))
+            f.write("\n")
+            count += 1
+    os.replace(tmp, path)
+    return count
+
+
+def write_ready_resumes(src: Path, dst: Path, workers: int = 0) -> int:
+    stats = Counter()
+    kept = write_jsonl(clean_resumes(load_jsonl(src), stats, workers=workers), dst)
+    print(f"Total records: {stats['total']}")
+    for rule in [name for name, _, _ in RESUME_RULES] + ['duplicate']:
+        print(f"Removed {stats[rule]} records ({rule})")
+    print(f"Final cleaned records: {kept}")
+    return kept
 
-    cleaned, removed_missing_name = remove_missing_name_records(cleaned)
-    print(f"Removed {removed_missing_name} records missing names")
 
-    cleaned, removed_missing_school = remove_missing_school(cleaned)
-    print(f"Removed {removed_missing_school} records missing school info")
+def prepare_resumes(base: Path):
+    """Clean data/resumes.jsonl into data/ready_resumes.jsonl on first use, then load it."""
+    src = base / "data" / "resumes.jsonl"
+    record_path = base / "data" / "ready_resumes.jsonl"
+    legacy_path = base / "data" / "ready_resumes.json"
+    if not record_path.exists():
+        if legacy_path.exists():
+            # Keep the order of an existing cleaned file so saved progress still lines up
+            print(f"Converting {legacy_path} to JSON lines")
+            with open(legacy_path, 'r', encoding='utf-8') as f:
+                write_jsonl(json.load(f), record_path)
+        elif not src.exists():
+            print(f"resumes.jsonl not found at {src}")
+            return None
+        else:
+            print(f"Writing cleaned resumes to {record_path}")
+            write_ready_resumes(src, record_path, workers=CLEAN_WORKERS)
+
+    cleaned = list(load_jsonl(record_path))
+    print(f"Loaded cleaned resumes from {record_path}, total: {len(cleaned)}")
+    return cleaned
 
-    cleaned, removed_missing_skills = remove_missing_skills_projects_records(cleaned)
-    print(f"Removed {removed_missing_skills} records missing skills or project info")
 
-    kept = len(cleaned)
-    print(f"Final cleaned records: {kept}")
-    return cleaned
+def use_data_dir(data_dir: Path):
+    """Keep the response cache, call telemetry and dead letters with the results in data_dir.
 
+    Paths are resolved from main.py, not the working directory, so a run
+    started from cron and a later redrive use the same files; a shard gets
+    its own. LLM_TELEMETRY_PATH, LLM_METRICS_PATH and DEAD_LETTER_PATH still
+    override them.
+    """
+    configure_response_cache(data_dir / "llm_cache.sqlite", enabled=os.getenv("LLM_CACHE", "1") != "0")
+    configure_telemetry(path=os.getenv("LLM_TELEMETRY_PATH") or data_dir / "llm_calls.jsonl",
+                        metrics_path=os.getenv("LLM_METRICS_PATH") or data_dir / "llm_metrics.prom",
+                        enabled=os.getenv("LLM_TELEMETRY", "1") != "0")
+    configure_dead_letters(os.getenv("DEAD_LETTER_PATH") or data_dir / "dead_letter.jsonl")
 
 
 async def main():
     np.random.seed(42)
     base = Path(__file__).resolve().parent
-    src = base / "data\\resumes.jsonl"
-    if not src.exists():
-        print(f"resumes.jsonl not found at {src}")
+    use_data_dir(base / "data")
+    cleaned = prepare_resumes(base)
+    if cleaned is None:
         return
 
-    records = list(load_jsonl(src))
-    total = len(records)
-    print(f"Total records: {total}")
-
-    record_path = base / "data\\ready_resumes.json"
-    if not record_path.exists():
-        cleaned = clean_resumes(records)
-        print("Writing cleaned resumes to data/ready_resumes.json")
-
-        with open("data\\ready_resumes.json", "w", encoding="utf-8") as json_file:
-            json_file.write("")
-            json.dump(cleaned, json_file, indent=2)
-    else:
-        with open(record_path, 'r', encoding='utf-8') as f:
-            cleaned = json.load(f)
-        print(f"Loaded cleaned resumes from {record_path}, total: {len(cleaned)}")
-
     sub = input("Do you want to create a smaller subset (progress saved)? (y/n): ")
     if sub.lower() == 'y':
         size = int(input("Enter the size of the subset: "))
     else:
         size = len(cleaned)
+    fused = input("Score overall/skills/projects/experience in one combined call per resume? (y/n): ").lower() == 'y'
+    batched = not fused and input("Score several resumes per call in the score stages? (y/n): ").lower() == 'y'
     print("\nStarting resume scoring...")
     selected_models = select_models()
     if not selected_models:
         print("No models selected. Skipping resume scoring.")
     else:
-        print(f"\nScoring resumes using models: {', '.join(selected_models)}")
-        # Score resumes with each selected model
-        batch = 0
-        batch_size = 25
-        for _ in range(0,size,25):
-            batch+= 1
-            print(f"Starting batch {batch} of {int(size/25)+1}")
-
-            for model in selected_models:
-                print(f"\nProcessing with model: {model}")
-
-                filename = f"data\\{model.replace(':', '_')}_resume_scores.csv"
-                output_path = base / filename
-                output_path.parent.mkdir(parents=True, exist_ok=True)
-
-                if output_path.exists():
-                    current = pd.read_csv(output_path).shape[0]
-                else:
-                    current = 0
-                subset = cleaned[current:current+50]
-                
-                with open("data\\cleaned_resumes.json", "w", encoding="utf-8") as json_file:
-                    json_file.write("")
-                    json.dump(list(subset), json_file, indent=2)
-                print("Resumes to score saved successfully.")
-
-                max_concurrent = 14
-                results = await score_resumes_concurrent(model=model, local=True, max_concurrent=max_concurrent)
-                demographics = await predict_demographics_concurrent(model=model, local=True, max_concurrent=max_concurrent)
-                prestige = await predict_prestige_concurrent(model=model, local=True, max_concurrent=max_concurrent)
-                skills = await score_skills_concurrent(model=model, local=True, max_concurrent=max_concurrent)
-                projects = await score_projects_concurrent(model=model, local=True, max_concurrent=max_concurrent)
-                exp = await score_experience_concurrent(model=model, local=True, max_concurrent=max_concurrent)
-                
-
-                print(f"Merging results...")
-                results = results.merge(demographics, how='left', on='name')
-                results = results.merge(prestige, how='left', on='name')
-                results = results.merge(skills, how='left', on='name')
-                results = results.merge(projects, how='left', on='name')
-                results = results.merge(exp, how='left', on='name')
-                results = results.merge(get_experience(), how='left', on='name')
-
-                if output_path.exists():
-                    print(f"Appending to existing file {filename}...")
-                    results.to_csv(output_path, mode='a', header=False, index=False)
-                else:
-                    print(f"Output file {filename} does not exist. Creating a new file...")
-                    results.to_csv(output_path, index=False)
-                
-                print(f"Saved scores for {model} to {filename}")
+        await score_models(selected_models, cleaned, size, base / "data", fused=fused, batched=batched)
+
+
+async def run(args):
+    """Headless `run`: everything comes from the command line, nothing is asked."""
+    np.random.seed(42)
+    base = Path(__file__).resolve().parent
+    cleaned = prepare_resumes(base)
+    if cleaned is None:
+        return
+    selected = cleaned[:args.size] if args.size else cleaned
+    data_dir = base / "data"
+    if args.shard is not None:
+        shard, shards = args.shard
+        total = len(selected)
+        selected = [resume for resume in selected if in_shard(resume, shard, shards)]
+        data_dir = shard_dir(data_dir, shard, shards)
+        data_dir.mkdir(parents=True, exist_ok=True)
+        print(f"Shard {shard}/{shards}: {len(selected)} of {total} resumes, writing to {data_dir}")
+    use_data_dir(data_dir)
+    await score_models(args.models, selected, len(selected), data_dir, fused=args.fused, batched=args.batched)
+
+
+async def score_models(models, cleaned, size, data_dir, fused=False, batched=False):
+    """Score with every model, then print the run's reports."""
+    print(f"\nScoring resumes using models: {', '.join(models)}")
+    # Run each model over every batch before moving on, so Ollama loads it once
+    groups = plan_resident_groups(models, list_ollama_model_sizes(), RAM_BUDGET_GB)
+    client = create_ollama_client(local=True)
+    journal = ProgressJournal(data_dir / "progress.sqlite")
+    for group in groups:
+        for model in group:
+            set_keep_alive(model, KEEP_ALIVE)
+            await warm_up_model(client, model, keep_alive=KEEP_ALIVE)
+        await asyncio.gather(*(score_model(model, cleaned, size, data_dir, fused=fused, batched=batched, journal=journal) for model in group))
+        for model in group:
+            set_keep_alive(model, None)
+            await unload_model(client, model)
+
+    report_parse_stats()
+    ENTITY_REGISTRY.report()
+    report_coalesced()
+    report_concurrency()
+    report_hosts()
+    report_prompt_eval()
+    report_prompt_tokens()
+    report_telemetry()
+    cache = get_response_cache()
+    if cache is not None:
+        cache.report()
+
+
+async def score_model(model, cleaned, size, data_dir, fused=False, batched=False, journal=None):
+    """Score the first `size` resumes with one model, in batches of 25.
+
+    Up to PIPELINE_WINDOW batches are scored at once while a background writer
+    saves finished batches in order. Progress is tracked per resume id in the
+    journal, so a restart only sends work for resumes (and stages) that have
+    not finished yet. Resumes with a dead-lettered stage are not written.
+    """
+    store = ResultStore(model, data_dir)
+    csv_path = Path(data_dir) / f"{store_name(model)}.csv"
+    journal = journal or ProgressJournal(Path(data_dir) / "progress.sqlite")
+
+    journal.recover(model)
+    if csv_path.exists() and not store.parts():
+        print(f"Importing {csv_path} into the result store...")
+        store.import_csv(csv_path)
+    if store.parts() and not journal.has_progress(model):
+        seed_journal_from_store(journal, model, store, cleaned)
+    written = journal.written_ids(model)
+    pending = [resume for resume in cleaned[:size] if resume_id(resume) not in written]
+    print(f"{model}: {size - len(pending)} of {size} resumes already scored")
+
+    batch_size = 25
+    subsets = [tuple(pending[start:start + batch_size]) for start in range(0, len(pending), batch_size)]
+
+    batch_numbers = {id(subset): number for number, subset in enumerate(subsets)}
+
+    async def score_batch(subset):
+        print(f"\nProcessing {len(subset)} resumes with model: {model}")
+        CURRENT_BATCH.set(batch_numbers[id(subset)])  # tags this batch's LLM calls in the telemetry
+        if WRITE_BATCH_FILE:
+            write_batch_file(subset, Path(data_dir) / "cleaned_resumes.json")
+        # Only an upper bound: each model's adaptive limiter decides how many requests are actually sent
+        stages = await run_stages_concurrent(subset, model=model, local=True, max_concurrent=MAX_CONCURRENCY, fused=fused, batched=batched, journal=journal)
+        return merge_stage_results(stages)
+
+    async def write_batch(subset, results):
+        held = len(subset) - len(results)
+        if held:
+            print(f"{model}: holding back {held} resumes with dead-lettered stages (see {dead_letter_path()})")
+        if results.empty:
+            return
+        part_path = store.next_part_path()
+        journal.begin_write(model, part_path, list(results['resume_id']))
+        await asyncio.to_thread(store.append, results, part_path)
+        journal.finish_write(model)
+        print(f"Saved scores for {model} to {part_path}")
+
+    await run_windowed(subsets, score_batch, write_batch, window=PIPELINE_WINDOW)
+
+    if subsets:
+        store.export_csv(csv_path)
+        print(f"Exported {store.row_count()} rows for {model} to {csv_path}")
+
+
+def seed_journal_from_store(journal, model, store, cleaned):
+    """One-off import of progress from results written before the journal existed.
+
+    Rows carry their resume_id; only rows imported from a legacy CSV, which
+    has none, are matched by name.
+    """
+    stored = store.read(columns=['resume_id', 'name'])
+    ids = set(stored['resume_id'].dropna())
+    names = set(stored.loc[stored['resume_id'].isna(), 'name'])
+    done = [resume_id(resume) for resume in cleaned if resume_id(resume) in ids or resume['personal_info']['name'] in names]
+    journal.mark_written(model, done)
+    print(f"Imported {len(done)} already scored resumes for {model} from {store.path}")
+
+
+def redrive_mode(journal, model, rid, stages):
+    """(fused, batched) a resume was scored with, from its failed stages or the ones already journaled."""
+    if 'fused' in stages or journal.stage_results(model, 'fused', [rid]):
+        return True, False
+    batched = any(stage.endswith('_batched') for stage in stages) or bool(journal.stage_results(model, 'score_batched', [rid]))
+    return False, batched
+
+
+async def redrive(shard=None):
+    """Re-run the dead-lettered stages, then keep only the entries that failed again.
+
+    Stages that already succeeded for a resume come from the journal, so only
+    the failed ones are sent again. With shard=(i, n) the shard's own journal
+    and results are used.
+    """
+    base = Path(__file__).resolve().parent
+    data_dir = shard_dir(base / "data", *shard) if shard is not None else base / "data"
+    use_data_dir(data_dir)
+    entries = load_dead_letters()
+    if not entries:
+        print(f"No dead letters in {dead_letter_path()}")
+        return
+    journal = ProgressJournal(data_dir / "progress.sqlite")
+    by_id = {resume_id(resume): resume for resume in load_jsonl(base / "data" / "ready_resumes.jsonl")}
+    if shard is not None:
+        by_id = {rid: resume for rid, resume in by_id.items() if in_shard(resume, *shard)}
+
+    written = {model: journal.written_ids(model) for model in {entry['model'] for entry in entries}}
+    failed = {}
+    for entry in entries:
+        failed.setdefault((entry['model'], entry['resume_id']), set()).add(entry['stage'])
+    runs = {}
+    for (model, rid), stages in failed.items():
+        if rid not in by_id or rid in written[model]:
+            continue
+        runs.setdefault((model, *redrive_mode(journal, model, rid, stages)), []).append(by_id[rid])
+
+    for (model, fused, batched), resumes in runs.items():
+        print(f"\nRe-driving {len(resumes)} resumes for {model}")
+        await score_model(model, resumes, len(resumes), data_dir, fused=fused, batched=batched, journal=journal)
+
+    # Entries of other shards are kept as they are
+    unresolved = [entry for entry in load_dead_letters()
+                  if entry['resume_id'] not in by_id or not journal.stage_results(entry['model'], entry['stage'], [entry['resume_id']])]
+    rewrite_dead_letters(unresolved)
+    print(f"{len(unresolved)} dead letters left in {dead_letter_path()}")
+    report_parse_stats()
+
+
+def shard_dir(data_dir: Path, shard, shards) -> Path:
+    """Where shard `shard` of `shards` keeps its journal and results."""
+    return Path(data_dir) / "shards" / f"shard-{shard}-of-{shards}"
+
+
+def merge_shards(data_dir: Path, models=None):
+    """Fold the shard results under data_dir/shards into the per-model result files.
+
+    Each model's shard parts are copied into its store in data_dir, the
+    resumes they hold are marked written in the main journal, and the CSV is
+    exported again. Parts merged by an earlier call are skipped, so this can
+    be re-run as shards finish.
+    """
+    shard_dirs = sorted(path for path in (data_dir / "shards").glob("shard-*") if path.is_dir())
+    if not shard_dirs:
+        print(f"No shard outputs under {data_dir / 'shards'}")
+        return
+    shard_journals = [ProgressJournal(path / "progress.sqlite") for path in shard_dirs]
+    models = models or sorted({model for shard_journal in shard_journals for model in shard_journal.models()})
+    journal = ProgressJournal(data_dir / "progress.sqlite")
+    for model in models:
+        sources = [ResultStore(model, path) for path in shard_dirs if (path / store_name(model)).is_dir()]
+        if not sources:
+            print(f"{model}: no shard results")
+            continue
+        store = ResultStore(model, data_dir)
+        added = store.merge(sources)
+        for shard_journal in shard_journals:
+            journal.mark_written(model, shard_journal.written_ids(model))
+        csv_path = data_dir / f"{store_name(model)}.csv"
+        store.export_csv(csv_path)
+        print(f"{model}: merged {added} new parts from {len(sources)} shards, exported {store.row_count()} rows to {csv_path}")
+    for shard_journal in shard_journals:
+        shard_journal.close()
+    journal.close()
+
+
+def parse_shard(text):
+    """'i/n' -> (i, n); shards are numbered from 0."""
+    try:
+        shard, shards = (int(part) for part in text.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/n, got {text!r}")
+    if not 0 <= shard < shards:
+        raise argparse.ArgumentTypeError(f"shard must be between 0 and {shards - 1}, got {shard}")
+    return shard, shards
+
+
+def parse_models(text):
+    return [model.strip() for model in text.split(",") if model.strip()]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Score resumes with local LLMs. With no command, asks for the settings interactively.")
+    commands = parser.add_subparsers(dest="command")
+
+    run_parser = commands.add_parser("run", help="score resumes without any prompts")
+    run_parser.add_argument("--models", type=parse_models, required=True, help="comma-separated Ollama models")
+    run_parser.add_argument("--size", type=int, help="only score the first SIZE cleaned resumes")
+    run_parser.add_argument("--shard", type=parse_shard, help="i/n: only score shard i (from 0) of n, chosen by resume id")
+    mode = run_parser.add_mutually_exclusive_group()
+    mode.add_argument("--fused", action="store_true", help="one combined call per resume for the four scores")
+    mode.add_argument("--batched", action="store_true", help="several resumes per call in the score stages")
+
+    merge_parser = commands.add_parser("merge", help="combine shard outputs into the per-model result files")
+    merge_parser.add_argument("--models", type=parse_models, help="comma-separated models (default: every model in the shards)")
+
+    redrive_parser = commands.add_parser("redrive", help="re-run dead-lettered stages")
+    redrive_parser.add_argument("--shard", type=parse_shard, help="i/n: the shard whose journal and results to use")
+    return parser.parse_args(argv)
+
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    args = parse_args()
+    if args.command == "run":
+        asyncio.run(run(args))
+    elif args.command == "merge":
+        merge_shards(Path(__file__).resolve().parent / "data", args.models)
+    elif args.command == "redrive":
+        asyncio.run(redrive(args.shard))
+    else:
+        asyncio.run(main())